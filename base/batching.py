@@ -0,0 +1,127 @@
+# base/batching.py
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.db.models.signals import post_save
+from wagtail.models import Page
+from wagtail.search import index
+from wagtail.search.backends import get_search_backends_with_name
+from wagtail.search.signal_handlers import post_save_signal_handler
+from wagtail.signals import page_published, page_unpublished
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_flush_handlers = []
+
+
+class PageSignalBatch:
+    """
+    What happened while a batch was open: the pages published or unpublished,
+    and the primary keys of indexed objects saved, by model.
+    """
+
+    def __init__(self):
+        self.page_ids = set()
+        self.indexed = {}
+
+
+def get_current_batch():
+    return getattr(_local, 'batch', None)
+
+
+def deferred_in_batch(receiver_func):
+    """
+    Decorate a page_published/page_unpublished receiver whose work can be done
+    once for many pages. While batched_page_signals() is open the page is only
+    recorded, and the app's on_flush handler covers it when the batch ends.
+    Other signals the receiver is connected to still run it right away.
+    """
+    @functools.wraps(receiver_func)
+    def wrapper(sender, **kwargs):
+        batch = get_current_batch()
+        if batch is not None and kwargs.get('signal') in (page_published, page_unpublished):
+            batch.page_ids.add(kwargs['instance'].pk)
+            return None
+        return receiver_func(sender, **kwargs)
+
+    return wrapper
+
+
+def on_flush(handler):
+    """
+    Register handler(pages) to run at the end of every batch with the specific
+    pages that were published or unpublished during it, in their current state.
+    """
+    _flush_handlers.append(handler)
+    return handler
+
+
+def record_indexed_save(sender, instance, **kwargs):
+    batch = get_current_batch()
+    if batch is None:
+        # Saved by another thread while this one holds a batch open.
+        post_save_signal_handler(instance, **kwargs)
+        return
+    batch.indexed.setdefault(sender, set()).add(instance.pk)
+
+
+@contextmanager
+def batched_page_signals():
+    """
+    Defer per-object search indexing and the deferred_in_batch receivers while
+    the block runs, e.g. a batch of imported articles, then index every saved
+    object with one add_bulk() per model and backend and run the on_flush
+    handlers once. Wagtail's indexing handler is disconnected for the whole
+    process, so open batches from management commands rather than requests.
+    Nested batches join the outer one.
+    """
+    batch = get_current_batch()
+    if batch is not None:
+        yield batch
+        return
+
+    batch = _local.batch = PageSignalBatch()
+    models = [model for model in index.get_indexed_models() if getattr(model, 'search_auto_update', True)]
+    for model in models:
+        post_save.disconnect(post_save_signal_handler, sender=model)
+        post_save.connect(record_indexed_save, sender=model)
+    try:
+        yield batch
+    finally:
+        for model in models:
+            post_save.disconnect(record_indexed_save, sender=model)
+            post_save.connect(post_save_signal_handler, sender=model)
+        _local.batch = None
+        flush(batch)
+
+
+def flush(batch):
+    for model, pks in batch.indexed.items():
+        index_objects(model, pks)
+
+    if batch.page_ids:
+        pages = list(Page.objects.filter(pk__in=batch.page_ids).specific())
+        for handler in _flush_handlers:
+            handler(pages)
+
+
+def index_objects(model, pks):
+    """
+    Add or update the given objects of one model in every auto-updated search
+    backend with a single bulk call each. Objects deleted since are skipped.
+    """
+    objects = list(model.get_indexed_objects().filter(pk__in=pks))
+    if not objects:
+        return
+    for backend_name, backend in get_search_backends_with_name(with_auto_update=True):
+        try:
+            backend.add_bulk(model, objects)
+        except Exception:
+            logger.exception("Exception raised while bulk indexing %s objects into the '%s' search backend",
+                             model.__name__, backend_name)
+            # As in wagtail.search.index.insert_or_update_object.
+            if not backend.catch_indexing_errors:
+                raise
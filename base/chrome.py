@@ -0,0 +1,81 @@
+# base/chrome.py
+from django.utils import timezone
+from wagtail.models import Site
+
+from base import page_cache
+from base.models import FooterText
+
+SITE_CHROME_KEY = "chrome:site:{site_id}"
+ANCESTORS_KEY = "chrome:ancestors:{site_id}:{page_id}"
+
+
+def build_site_chrome(site, request=None):
+    """
+    Collect what the navigation and footer show for a site: the live footer
+    text and the knowledge base and about page URLs, with the time they were
+    collected for pages' Last-Modified. Returns (snapshot, tags), where the
+    tags are the page cache tags whose invalidation makes the snapshot stale.
+    """
+    from about.models import AboutPage
+    from knowledgebase.models import IndexPage
+
+    root_page = site.root_page
+    kb_page = IndexPage.objects.live().descendant_of(root_page).order_by('path').first()
+    about_page = AboutPage.objects.live().descendant_of(root_page).order_by('path').first()
+    footer = FooterText.objects.filter(live=True).first()
+
+    snapshot = {
+        'footer_text': footer.body if footer else "",
+        'kb_url': kb_page.get_url(request=request) if kb_page else None,
+        'about_url': about_page.get_url(request=request) if about_page else None,
+        'built_at': timezone.now(),
+    }
+
+    tags = {page_cache.SNIPPETS_TAG, page_cache.page_tag(root_page.pk)}
+    for page in (kb_page, about_page):
+        if page is not None:
+            tags.add(page_cache.page_tag(page.pk))
+    if kb_page is None or about_page is None:
+        # Notice when the missing page gets published somewhere under the site.
+        tags.add(page_cache.children_tag(root_page.pk))
+    return snapshot, tags
+
+
+def get_site_chrome(request):
+    """
+    Return the cached chrome snapshot for the request's site, building it on a
+    miss. It only goes stale when the footer, the site or one of the linked
+    pages changes, so most requests just validate a few tag versions.
+    """
+    memo = getattr(request, '_site_chrome', None)
+    if memo is not None:
+        return memo
+
+    site = Site.find_for_request(request)
+    if site is None:
+        return None
+
+    key = SITE_CHROME_KEY.format(site_id=site.pk)
+    snapshot = page_cache.get_tagged(key)
+    if snapshot is None:
+        snapshot, tags = build_site_chrome(site, request)
+        page_cache.set_tagged(key, snapshot, tags)
+    request._site_chrome = snapshot
+    return snapshot
+
+
+def get_ancestor_chain(page, request):
+    """
+    Return the breadcrumb trail above a page as a list of {'title', 'url'}
+    dicts, skipping the tree root. Cached until one of the ancestors is
+    published, moved or deleted.
+    """
+    site = Site.find_for_request(request)
+    key = ANCESTORS_KEY.format(site_id=site.pk if site else 0, page_id=page.pk)
+    chain = page_cache.get_tagged(key)
+    if chain is None:
+        ancestors = list(page.get_ancestors().filter(depth__gt=1))
+        chain = [{'title': ancestor.title, 'url': ancestor.get_url(request=request)} for ancestor in ancestors]
+        tags = {page_cache.page_tag(page.pk), *(page_cache.page_tag(ancestor.pk) for ancestor in ancestors)}
+        page_cache.set_tagged(key, chain, tags)
+    return chain
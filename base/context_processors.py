@@ -1,6 +1,8 @@
 # from wagtail import Site
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 from django.utils.http import url_has_allowed_host_and_scheme
+from base.chrome import get_site_chrome
 from base.models import SiteSettings
 
 def navigation_links(request):
@@ -8,6 +10,9 @@ def navigation_links(request):
     return {
 
         'site_name': "OptiFit", 
+        # Footer text, nav URLs and settings from the cached snapshot, only
+        # looked up when a template uses them.
+        'chrome': SimpleLazyObject(lambda: get_site_chrome(request) or {}),
     }
 
 
@@ -0,0 +1,59 @@
+# base/middleware.py
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, has_vary_header
+from django.utils.http import parse_http_date_safe
+
+from base import page_cache
+
+
+class AnonymousPageCacheMiddleware:
+    """
+    Caches anonymous GET responses for Wagtail-served pages. Pages are marked
+    cacheable by the before_serve_page hook in base/wagtail_hooks.py, which
+    records the tags the response depends on; publishing, moving or deleting a
+    page and editing shared snippets invalidate those tags (see base/signals.py).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self.is_cacheable_request(request):
+            return self.get_response(request)
+
+        entry = page_cache.get_cached_response(request)
+        if entry is not None:
+            return self.build_response(request, entry)
+
+        response = self.get_response(request)
+
+        tags = getattr(request, 'page_cache_tags', None)
+        if tags and self.is_cacheable_response(response):
+            page_cache.store_response(request, response, tags, request.page_cache_path)
+        return response
+
+    def is_cacheable_request(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        user = getattr(request, 'user', None)
+        return not (user is not None and user.is_authenticated)
+
+    def is_cacheable_response(self, response):
+        if response.status_code != 200 or response.streaming or response.cookies:
+            return False
+        # The cache key is only the URL, so a response that varies by session
+        # would be served to every visitor.
+        if has_vary_header(response, 'Cookie'):
+            return False
+        cache_control = response.get('Cache-Control', '')
+        return 'private' not in cache_control and 'no-store' not in cache_control
+
+    def build_response(self, request, entry):
+        headers = entry['headers']
+        last_modified = parse_http_date_safe(headers.get('Last-Modified', ''))
+        response = get_conditional_response(request, etag=headers.get('ETag'), last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(entry['content'], status=entry['status'])
+        for header, value in headers.items():
+            response.headers.setdefault(header, value)
+        return response
@@ -0,0 +1,190 @@
+# base/page_cache.py
+import hashlib
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from wagtail.models import Page, PageViewRestriction
+
+# Tag for content shared by every page: footer text and site/navigation settings.
+SNIPPETS_TAG = "snippets"
+
+ENTRY_KEY = "pagecache:entry:{digest}"
+TAG_VERSION_KEY = "pagecache:tag:{tag}"
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidations': 0}
+
+
+def get_cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 60)
+
+
+def page_tag(page_id):
+    return f"page:{page_id}"
+
+
+def children_tag(page_id):
+    return f"children:{page_id}"
+
+
+def get_page_cache_tags(page):
+    """
+    Tags a page's response depends on: the page and its ancestors (titles and URLs
+    shown in the breadcrumb), the page's own children (listings) and the shared
+    snippets. Pages can add their own tags by defining get_cache_tags().
+    """
+    ancestor_ids = page.get_ancestors().values_list('pk', flat=True)
+    tags = {page_tag(page.pk), children_tag(page.pk), SNIPPETS_TAG}
+    tags.update(page_tag(ancestor_id) for ancestor_id in ancestor_ids)
+    if hasattr(page, 'get_cache_tags'):
+        tags.update(page.get_cache_tags())
+    return tags
+
+
+def get_changed_page_tags(page):
+    """
+    Tags to invalidate when a page is published, unpublished, moved or deleted:
+    the page itself (and so its descendants' breadcrumbs) and the child listings
+    of every ancestor, whose listings and counts include it.
+    """
+    ancestor_ids = page.get_ancestors().values_list('pk', flat=True)
+    return {page_tag(page.pk), *(children_tag(ancestor_id) for ancestor_id in ancestor_ids)}
+
+
+def entry_key(request):
+    digest = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+    return ENTRY_KEY.format(digest=digest)
+
+
+def get_tag_versions(tags, create=False):
+    """
+    Return the current version token for each tag. With create=True, tags that
+    have no version yet (or were evicted) get a fresh one.
+    """
+    cache = get_cache()
+    keys = {tag: TAG_VERSION_KEY.format(tag=tag) for tag in tags}
+    stored = cache.get_many(keys.values())
+    versions = {tag: stored.get(key) for tag, key in keys.items()}
+
+    if create:
+        missing = {keys[tag]: uuid.uuid4().hex for tag, version in versions.items() if version is None}
+        if missing:
+            cache.set_many(missing, timeout=None)
+            versions.update({tag: missing[keys[tag]] for tag in versions if versions[tag] is None})
+    return versions
+
+
+def has_view_restrictions(page_path):
+    """
+    Whether the page at page_path or one of its ancestors has a view
+    restriction, checked from the tree path alone with one query.
+    """
+    paths = [page_path[:end] for end in range(Page.steplen, len(page_path) + 1, Page.steplen)]
+    return PageViewRestriction.objects.filter(page__path__in=paths).exists()
+
+
+def get_cached_response(request):
+    """
+    Return the stored {'status', 'headers', 'content'} entry for a request, or
+    None if there isn't one, any of its tags was invalidated since it was
+    stored or its page has been put behind a view restriction.
+    """
+    entry = get_cache().get(entry_key(request))
+    if (
+        entry is not None
+        and get_tag_versions(entry['tags']) == entry['tags']
+        and entry.get('page_path') is not None
+        and not has_view_restrictions(entry['page_path'])
+    ):
+        _count('hits')
+        return entry
+    _count('misses')
+    return None
+
+
+def store_response(request, response, tags, page_path):
+    get_cache().set(
+        entry_key(request),
+        {
+            'status': response.status_code,
+            'headers': dict(response.headers),
+            'content': response.content,
+            'tags': get_tag_versions(tags, create=True),
+            'page_path': page_path,
+        },
+        timeout=get_timeout(),
+    )
+    _count('stores')
+
+
+def get_tagged(key):
+    """
+    Return a value stored with set_tagged, or None if it is missing or any of
+    its tags was invalidated since it was stored.
+    """
+    entry = get_cache().get(key)
+    if entry is not None and get_tag_versions(entry['tags']) == entry['tags']:
+        return entry['value']
+    return None
+
+
+def set_tagged(key, value, tags, timeout=None):
+    """
+    Store a value that is dropped when any of the tags is invalidated, like the
+    cached page responses.
+    """
+    get_cache().set(
+        key,
+        {'value': value, 'tags': get_tag_versions(tags, create=True)},
+        timeout=timeout if timeout is not None else get_timeout(),
+    )
+
+
+def invalidate_tags(tags):
+    """
+    Invalidate every cached response carrying any of the tags by giving each tag
+    a new version token.
+    """
+    tags = set(tags)
+    if not tags:
+        return
+    get_cache().set_many(
+        {TAG_VERSION_KEY.format(tag=tag): uuid.uuid4().hex for tag in tags},
+        timeout=None,
+    )
+    _count('invalidations', len(tags))
+
+
+def invalidate_page(page):
+    invalidate_tags(get_changed_page_tags(page))
+
+
+def invalidate_subtree(page):
+    """
+    Invalidate a page, every page below it and the listings that show it, e.g.
+    when a view restriction covering them is added or removed.
+    """
+    descendant_ids = page.get_descendants().values_list('pk', flat=True)
+    invalidate_tags(get_changed_page_tags(page) | {page_tag(page_id) for page_id in descendant_ids})
+
+
+def page_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_page_cache_stats():
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
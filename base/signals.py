@@ -0,0 +1,63 @@
+# base/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from wagtail.models import Page, PageViewRestriction, Site
+from wagtail.signals import page_published, page_unpublished, post_page_move
+
+from base import batching, page_cache
+from base.models import FooterText, NavigationSettings, SiteSettings
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+@batching.deferred_in_batch
+def invalidate_page_cache_on_publish(sender, instance, **kwargs):
+    page_cache.invalidate_page(instance)
+
+
+@batching.on_flush
+def invalidate_page_cache_for_batch(pages):
+    tags = set()
+    for page in pages:
+        tags.update(page_cache.get_changed_page_tags(page))
+    page_cache.invalidate_tags(tags)
+
+
+@receiver(post_page_move)
+def invalidate_page_cache_on_move(sender, instance, parent_page_before, parent_page_after, **kwargs):
+    # The moved page is now listed under its new ancestors; the listings of its
+    # old parent and that parent's ancestors lost it.
+    old_ancestor_ids = parent_page_before.get_ancestors(inclusive=True).values_list('pk', flat=True)
+    tags = page_cache.get_changed_page_tags(instance)
+    tags.update(page_cache.children_tag(page_id) for page_id in old_ancestor_ids)
+    page_cache.invalidate_tags(tags)
+
+
+@receiver(post_delete)
+def invalidate_page_cache_on_delete(sender, instance, **kwargs):
+    # Deleting a specific page sends post_delete for each model in its
+    # inheritance chain; react once, for the base Page row.
+    if sender is Page:
+        page_cache.invalidate_page(instance)
+
+
+@receiver(post_save, sender=PageViewRestriction)
+@receiver(post_delete, sender=PageViewRestriction)
+def invalidate_page_cache_on_view_restriction(sender, instance, **kwargs):
+    # A restriction covers the page and everything below it, whose cached
+    # responses would otherwise keep being served to anonymous visitors.
+    page = Page.objects.filter(pk=instance.page_id).first()
+    if page is None:
+        page_cache.invalidate_tags([page_cache.page_tag(instance.page_id)])
+        return
+    page_cache.invalidate_subtree(page)
+
+
+@receiver(post_save, sender=FooterText)
+@receiver(post_delete, sender=FooterText)
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_save, sender=NavigationSettings)
+@receiver(post_save, sender=Site)
+def invalidate_page_cache_on_snippet_save(sender, **kwargs):
+    # Also drops the site chrome snapshot (base.chrome), which carries this tag.
+    page_cache.invalidate_tags([page_cache.SNIPPETS_TAG])
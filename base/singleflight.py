@@ -0,0 +1,237 @@
+# base/singleflight.py
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; see get_lock_dir().
+    fcntl = None
+
+LOCK_KEY = "singleflight:lock:{digest}"
+
+# File locks are striped over a fixed number of files so the lock directory
+# doesn't grow with the number of keys; keys sharing a stripe wait for each other.
+LOCK_STRIPES = 256
+
+# How often a caller waiting on another process re-checks for its result.
+POLL_INTERVAL = 0.05
+
+_calls = {}
+_calls_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    'leaders': 0,
+    'coalesced': 0,
+    'shared_waits': 0,
+    'shared_hits': 0,
+    'fallbacks': 0,
+    'wait_seconds': 0.0,
+}
+
+
+def get_cache():
+    return caches[getattr(settings, 'SINGLEFLIGHT_CACHE_ALIAS', 'default')]
+
+
+def get_lock_timeout():
+    return getattr(settings, 'SINGLEFLIGHT_LOCK_TIMEOUT', 30)
+
+
+def get_wait_timeout():
+    return getattr(settings, 'SINGLEFLIGHT_WAIT_TIMEOUT', 10)
+
+
+def get_lock_dir():
+    """
+    Where file locks are taken, or None to lock with cache.add(). Defaults to
+    a "<cache dir>-locks" directory next to a FileBasedCache, whose add() is a
+    separate existence check and write, so two processes can both "add" the
+    same key. Other backends must have an atomic add() (Redis, Memcached, the
+    database cache) to coalesce across processes; LocMemCache is only shared
+    by the threads of one process.
+    """
+    configured = getattr(settings, 'SINGLEFLIGHT_LOCK_DIR', None)
+    if configured:
+        return configured
+    cache = get_cache()
+    if fcntl is not None and isinstance(cache, FileBasedCache):
+        return f"{os.path.normpath(cache._dir)}-locks"
+    return None
+
+
+def lock_key(key):
+    digest = hashlib.sha1(str(key).encode()).hexdigest()
+    return LOCK_KEY.format(digest=digest)
+
+
+class CacheLock:
+    """A lock held by whoever first cache.add()s its key, until it expires."""
+
+    def __init__(self, key):
+        self.cache = get_cache()
+        self.key = lock_key(key)
+        self.token = uuid.uuid4().hex
+
+    def acquire(self):
+        return self.cache.add(self.key, self.token, timeout=get_lock_timeout())
+
+    def release(self):
+        if self.cache.get(self.key) == self.token:
+            self.cache.delete(self.key)
+
+
+class FileLock:
+    """
+    An exclusive flock() on one of LOCK_STRIPES files in directory. The
+    kernel releases it if the holder dies, so it never needs to expire.
+    """
+
+    def __init__(self, key, directory):
+        stripe = int(hashlib.sha1(str(key).encode()).hexdigest(), 16) % LOCK_STRIPES
+        self.directory = directory
+        self.path = os.path.join(directory, f"{stripe:03d}.lock")
+        self.file = None
+
+    def acquire(self):
+        os.makedirs(self.directory, exist_ok=True)
+        f = open(self.path, 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            return False
+        self.file = f
+        return True
+
+    def release(self):
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        finally:
+            self.file.close()
+            self.file = None
+
+
+def get_lock(key):
+    directory = get_lock_dir()
+    return FileLock(key, directory) if directory else CacheLock(key)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def do(key, compute):
+    """
+    Run compute() once per key among the threads of this process: callers that
+    arrive while it is running wait for it and share its result (or exception)
+    instead of running it again.
+    """
+    with _calls_lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        _count('coalesced')
+        started = time.monotonic()
+        call.done.wait()
+        _count('wait_seconds', time.monotonic() - started)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    _count('leaders')
+    try:
+        call.result = compute()
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _calls_lock:
+            del _calls[key]
+        call.done.set()
+    return call.result
+
+
+def do_shared(key, compute, lookup):
+    """
+    Run compute() once per key across processes, holding the lock from
+    get_lock(). compute() must store its result where lookup() finds it;
+    lookup() returns None until then. A caller that doesn't get the lock polls
+    lookup() and retries the lock until the result appears, takes over if the
+    holder gives up (fails, or its lock expires or dies with it), and computes
+    the result itself without the lock if SINGLEFLIGHT_WAIT_TIMEOUT passes
+    first.
+    """
+    lock = get_lock(key)
+    if lock.acquire():
+        return _compute_locked(lock, compute, lookup)
+
+    _count('shared_waits')
+    started = time.monotonic()
+    deadline = started + get_wait_timeout()
+    try:
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            value = lookup()
+            if value is not None:
+                _count('shared_hits')
+                return value
+            if lock.acquire():
+                break
+        else:
+            lock = None
+    finally:
+        _count('wait_seconds', time.monotonic() - started)
+
+    if lock is not None:
+        return _compute_locked(lock, compute, lookup)
+    _count('fallbacks')
+    return compute()
+
+
+def _compute_locked(lock, compute, lookup):
+    try:
+        # Another process may have stored the result just before we locked.
+        value = lookup()
+        return value if value is not None else compute()
+    finally:
+        lock.release()
+
+
+def coalesce(key, compute, lookup):
+    """
+    Coalesce identical computations within this process and then across
+    processes, e.g. to stop a burst of requests for a just-invalidated cache
+    entry from all rebuilding it at once. See do_shared() for the contract of
+    compute and lookup.
+    """
+    return do(key, lambda: do_shared(key, compute, lookup))
+
+
+def singleflight_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_singleflight_stats():
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
@@ -1,6 +1,6 @@
 from django import template
 from wagtail.models import Site
-from base.models import FooterText
+from base.chrome import get_ancestor_chain, get_site_chrome
 
 register = template.Library()
 
@@ -10,8 +10,8 @@ def get_footer_text(context):
     footer_text = context.get("footer_text", "")
 
     if not footer_text:
-        instance = FooterText.objects.filter(live=True).first()
-        footer_text = instance.body if instance else ""
+        chrome = get_site_chrome(context["request"])
+        footer_text = chrome["footer_text"] if chrome else ""
 
     return {
         "footer_text": footer_text,
@@ -20,4 +20,15 @@ def get_footer_text(context):
 
 @register.simple_tag(takes_context=True)
 def get_site_root(context):
-    return Site.find_for_request(context["request"]).root_page
\ No newline at end of file
+    # Site.find_for_request memoizes the site on the request.
+    return Site.find_for_request(context["request"]).root_page
+
+
+@register.simple_tag(takes_context=True)
+def get_breadcrumbs(context, page):
+    """
+    Cached [{'title', 'url'}] trail of the page's ancestors, without the root.
+    """
+    if page is None or not getattr(page, "pk", None):
+        return []
+    return get_ancestor_chain(page, context["request"])
@@ -1,3 +1,287 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import Client, SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from wagtail.models import PageViewRestriction
+
+from base.middleware import AnonymousPageCacheMiddleware
+from base import batching, chrome, page_cache, singleflight
+from base.models import FooterText
+from knowledgebase.models import ArticlePage, ArticleRenderedContent, Reviewer
+from knowledgebase.tests import KnowledgebaseTestCase
+
+
+class AnonymousPageCacheTests(KnowledgebaseTestCase):
+    def setUp(self):
+        super().setUp()
+        page_cache.reset_page_cache_stats()
+
+    def get_uncached(self, url):
+        """
+        GET a page and assert the page itself was served rather than the cache.
+        """
+        with mock.patch.object(ArticlePage, "serve", autospec=True, side_effect=ArticlePage.serve) as serve:
+            response = self.client.get(url)
+        return response, serve.call_count
+
+    def test_second_anonymous_view_is_served_from_cache(self):
+        first = self.client.get(self.article.url)
+        response, served = self.get_uncached(self.article.url)
+
+        self.assertEqual(served, 0)
+        self.assertEqual(response.content, first.content)
+        self.assertEqual(response["ETag"], first["ETag"])
+        self.assertEqual(page_cache.page_cache_stats()["hits"], 1)
+
+    def test_cached_response_answers_conditional_get(self):
+        etag = self.client.get(self.article.url)["ETag"]
+        response = self.client.get(self.article.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_publishing_invalidates_page_and_parent_category(self):
+        self.client.get(self.article.url)
+        self.client.get(self.category_page.url)
+        other_category = self.create_category("Skin")
+        other_article = self.create_article(other_category, "Eczema")
+        self.client.get(other_article.url)
+
+        self.article.save_revision().publish()
+
+        self.assertEqual(self.get_uncached(self.article.url)[1], 1)
+        self.assertNotContains(self.client.get(self.category_page.url), "Eczema")
+        self.assertEqual(page_cache.page_cache_stats()["hits"], 0)
+        self.assertEqual(self.get_uncached(other_article.url)[1], 0)
+
+    def test_snippet_edit_invalidates_every_page(self):
+        self.client.get(self.article.url)
+        FooterText.objects.create(body="<p>Footer</p>", live=True)
+        self.assertEqual(self.get_uncached(self.article.url)[1], 1)
+
+    def test_reviewer_edit_invalidates_reviewed_articles(self):
+        reviewer = Reviewer.objects.create(name="Dr. Lee")
+        article = self.create_article(self.category_page, "Bursitis", reviewer=reviewer)
+        self.client.get(article.url)
+        self.client.get(self.article.url)
+
+        reviewer.name = "Dr. Kim"
+        reviewer.save()
+
+        self.assertContains(self.client.get(article.url), "Dr. Kim")
+        self.assertEqual(self.get_uncached(self.article.url)[1], 0)
+
+    def test_moving_an_article_invalidates_both_categories(self):
+        other_category = self.create_category("Skin")
+        self.client.get(self.category_page.url)
+        self.client.get(other_category.url)
+
+        self.article.move(other_category, pos="last-child")
+
+        self.assertNotContains(self.client.get(self.category_page.url), "Gout")
+        self.assertContains(self.client.get(other_category.url), "Gout")
+
+    def test_password_restricted_pages_are_never_cached(self):
+        PageViewRestriction.objects.create(page=self.article, restriction_type="password", password="secret")
+        locked = self.client.get(self.article.url)
+        self.assertNotContains(locked, "article-body")
+
+        unlock_url = reverse("wagtailcore_authenticate_with_password", args=[
+            PageViewRestriction.objects.get(page=self.article).pk, self.article.pk,
+        ])
+        self.client.post(unlock_url, {"password": "secret", "return_url": self.article.url})
+        self.assertContains(self.client.get(self.article.url), "article-body")
+
+        response = Client().get(self.article.url)
+        self.assertNotContains(response, "article-body")
+        self.assertEqual(page_cache.page_cache_stats()["stores"], 0)
+
+    def test_adding_a_view_restriction_drops_cached_responses(self):
+        self.client.get(self.article.url)
+        self.assertEqual(page_cache.page_cache_stats()["stores"], 1)
+
+        PageViewRestriction.objects.create(page=self.category_page, restriction_type="password", password="secret")
+        # The receiver alone must retire the entry, without the check on hits.
+        with mock.patch.object(page_cache, "has_view_restrictions", return_value=False):
+            self.assertNotContains(self.client.get(self.article.url), "article-body")
+        self.assertEqual(page_cache.page_cache_stats()["hits"], 0)
+
+    def test_cached_responses_are_not_served_once_restricted(self):
+        self.client.get(self.article.url)
+        # As if the restriction was added without its post_save signal.
+        with mock.patch.object(page_cache, "invalidate_subtree"):
+            PageViewRestriction.objects.create(page=self.article, restriction_type="password", password="secret")
+        self.assertNotContains(self.client.get(self.article.url), "article-body")
+        self.assertEqual(page_cache.page_cache_stats()["hits"], 0)
+
+    def test_responses_varying_by_cookie_are_not_stored(self):
+        response = HttpResponse("private")
+        patch_vary_headers(response, ["Cookie"])
+        self.assertFalse(AnonymousPageCacheMiddleware(None).is_cacheable_response(response))
+
+    def test_logged_in_users_bypass_the_cache(self):
+        self.client.get(self.article.url)
+        self.client.force_login(self.create_user())
+        self.assertEqual(self.get_uncached(self.article.url)[1], 1)
+
+    def create_user(self):
+        from django.contrib.auth import get_user_model
+
+        return get_user_model().objects.create_user(username="editor", password="x")
+
+
+class SiteChromeTests(KnowledgebaseTestCase):
+    def setUp(self):
+        super().setUp()
+        # Logged-in requests skip the page cache, so every request renders.
+        self.client.force_login(AnonymousPageCacheTests.create_user(self))
+
+    def count_builds(self, *urls):
+        with mock.patch.object(chrome, "build_site_chrome", side_effect=chrome.build_site_chrome) as build:
+            responses = [self.client.get(url) for url in urls]
+        return responses, build.call_count
+
+    def test_snapshot_is_built_once_across_requests(self):
+        responses, builds = self.count_builds(self.article.url, self.category_page.url, self.article.url)
+        self.assertEqual(builds, 1)
+        self.assertContains(responses[0], f'href="{self.index_page.url}">Knowledge Base')
+
+    def test_footer_changes_rebuild_the_snapshot(self):
+        self.client.get(self.article.url)
+        FooterText.objects.create(body="<p>Footer</p>", live=True)
+        self.assertEqual(self.count_builds(self.article.url)[1], 1)
+
+    def test_breadcrumb_follows_ancestor_renames(self):
+        self.assertContains(self.client.get(self.article.url), ">Joints</a>")
+        self.category_page.title = "Bones and Joints"
+        self.category_page.save_revision().publish()
+
+        self.assertContains(self.client.get(self.article.url), ">Bones and Joints</a>")
+
+
+class PageSignalBatchTests(KnowledgebaseTestCase):
+    def search(self, query):
+        return {page.title for page in ArticlePage.objects.live().search(query)}
+
+    def test_indexing_and_receivers_run_once_per_batch(self):
+        with mock.patch("knowledgebase.typeahead.update_page") as update_page, \
+                mock.patch("knowledgebase.typeahead.rebuild") as rebuild, \
+                mock.patch("wagtail.search.index.insert_or_update_object") as index_object:
+            with batching.batched_page_signals():
+                first = self.create_article(self.category_page, "Gout flare", intro="A painful tophus.")
+                second = self.create_article(self.category_page, "Chronic gout", intro="Tophus deposits.")
+                self.assertEqual(self.search("tophus"), set())
+                self.assertFalse(ArticleRenderedContent.objects.filter(page__in=[first, second]).exists())
+
+        index_object.assert_not_called()
+        update_page.assert_not_called()
+        rebuild.assert_called_once()
+        self.assertEqual(self.search("tophus"), {"Gout flare", "Chronic gout"})
+        self.assertEqual(ArticleRenderedContent.objects.filter(page__in=[first, second]).count(), 2)
+
+    def test_receivers_run_immediately_outside_a_batch(self):
+        with mock.patch("knowledgebase.typeahead.update_page") as update_page:
+            self.create_article(self.category_page, "Gout flare", intro="A painful tophus.")
+        self.assertTrue(update_page.called)
+        self.assertEqual(self.search("tophus"), {"Gout flare"})
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        singleflight.reset_singleflight_stats()
+
+    def test_concurrent_threads_share_one_computation(self):
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return "result"
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(singleflight.do("key", compute)))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while singleflight.singleflight_stats()["coalesced"] < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["result"] * 4)
+        self.assertEqual(len(calls), 1)
+        stats = singleflight.singleflight_stats()
+        self.assertEqual((stats["leaders"], stats["coalesced"]), (1, 3))
+
+    def test_errors_are_raised_and_not_remembered(self):
+        with self.assertRaises(ValueError):
+            singleflight.do("key", mock.Mock(side_effect=ValueError))
+        self.assertEqual(singleflight.do("key", lambda: "retried"), "retried")
+
+    def test_waits_for_the_result_of_another_process(self):
+        # Another process holds the lock and stores its result shortly after.
+        cache.add(singleflight.lock_key("key"), "other", timeout=30)
+        threading.Timer(0.1, cache.set, ("value", "shared")).start()
+        compute = mock.Mock(return_value="recomputed")
+
+        self.assertEqual(singleflight.do_shared("key", compute, lambda: cache.get("value")), "shared")
+        compute.assert_not_called()
+        stats = singleflight.singleflight_stats()
+        self.assertEqual((stats["shared_waits"], stats["shared_hits"]), (1, 1))
+
+    @override_settings(SINGLEFLIGHT_WAIT_TIMEOUT=0.2)
+    def test_computes_itself_when_the_other_process_gives_up(self):
+        cache.add(singleflight.lock_key("key"), "other", timeout=30)
+        compute = mock.Mock(return_value="recomputed")
+
+        self.assertEqual(singleflight.do_shared("key", compute, lambda: None), "recomputed")
+        compute.assert_called_once()
+        self.assertEqual(singleflight.singleflight_stats()["fallbacks"], 1)
+
+    def test_takes_over_when_the_other_process_releases_the_lock(self):
+        cache.add(singleflight.lock_key("key"), "other", timeout=30)
+        threading.Timer(0.1, cache.delete, (singleflight.lock_key("key"),)).start()
+        compute = mock.Mock(return_value="recomputed")
+
+        self.assertEqual(singleflight.do_shared("key", compute, lambda: None), "recomputed")
+        compute.assert_called_once()
+        self.assertEqual(singleflight.singleflight_stats()["fallbacks"], 0)
+        self.assertIsNone(cache.get(singleflight.lock_key("key")))
+
+    def test_file_based_cache_locks_with_flock(self):
+        with tempfile.TemporaryDirectory() as directory:
+            location = os.path.join(directory, "cache")
+            caches_setting = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location}}
+            with override_settings(CACHES=caches_setting):
+                lock = singleflight.get_lock("key")
+                self.assertIsInstance(lock, singleflight.FileLock)
+                self.assertEqual(lock.directory, f"{location}-locks")
+
+    def test_waits_on_a_file_lock_held_by_another_process(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(SINGLEFLIGHT_LOCK_DIR=directory):
+            other = singleflight.get_lock("key")
+            self.assertTrue(other.acquire())
+            self.assertFalse(singleflight.get_lock("key").acquire())
+            threading.Timer(0.1, cache.set, ("value", "shared")).start()
+            compute = mock.Mock(return_value="recomputed")
+            try:
+                self.assertEqual(singleflight.do_shared("key", compute, lambda: cache.get("value")), "shared")
+            finally:
+                other.release()
+            compute.assert_not_called()
+
+            self.assertEqual(singleflight.do_shared("other", lambda: "computed", lambda: None), "computed")
+            lock = singleflight.get_lock("key")
+            self.assertTrue(lock.acquire())
+            lock.release()
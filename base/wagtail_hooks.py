@@ -0,0 +1,17 @@
+from wagtail import hooks
+
+from base.page_cache import get_page_cache_tags
+
+
+@hooks.register("before_serve_page")
+def tag_page_for_cache(page, request, serve_args, serve_kwargs):
+    # Only anonymous responses are cached, so skip the ancestor lookup otherwise.
+    user = getattr(request, "user", None)
+    if request.method not in ("GET", "HEAD") or (user and user.is_authenticated):
+        return
+    # Pages behind a password, login or group restriction (their own or an
+    # ancestor's) depend on the visitor's session, so they are never cached.
+    if page.get_view_restrictions().exists():
+        return
+    request.page_cache_tags = get_page_cache_tags(page)
+    request.page_cache_path = page.path
@@ -1,7 +1,7 @@
 # knowledgebase/blocks.py
 from django import forms
 from wagtail import blocks
-from markdown import Markdown  # Or from mistune import Markdown
+from knowledgebase.markdown_service import convert_markdown
 from django.utils.safestring import mark_safe
 
 
@@ -83,5 +83,4 @@ class MarkdownBlock(blocks.TextBlock):
         # self.field.widget = forms.Textarea(attrs={'class': 'markdown-widget'})
 
     def render_basic(self, value, context=None):
-        md = Markdown(extensions=['extra', 'codehilite'])  # Add extensions as needed
-        return mark_safe(md.convert(value))
\ No newline at end of file
+        return mark_safe(convert_markdown(value))
\ No newline at end of file
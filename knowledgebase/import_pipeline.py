@@ -0,0 +1,184 @@
+# knowledgebase/import_pipeline.py
+import gzip
+import hashlib
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+JSONL_SUFFIXES = ('.jsonl', '.ndjson')
+
+# Bump whenever generate_wagtail_streamfield_data or the fields the importer
+# sets change, so articles imported by the old code aren't skipped as unchanged.
+IMPORT_VERSION = 1
+
+
+def compute_source_hash(article_data):
+    """
+    Hash of an article's source JSON that ignores key order and formatting,
+    stored on ArticlePage.source_hash to detect unchanged re-imports.
+    """
+    canonical = json.dumps(article_data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(f"{IMPORT_VERSION}:{canonical}".encode('utf-8')).hexdigest()
+
+
+class JsonlRecord:
+    """
+    One line of a JSONL bundle: its text, line number and the byte offsets
+    (in the uncompressed stream) where it starts and where the next line
+    starts, which is the resume point once it has been imported.
+    """
+
+    def __init__(self, path, line_number, offset, end_offset, text):
+        self.path = path
+        self.line_number = line_number
+        self.offset = offset
+        self.end_offset = end_offset
+        self.text = text
+
+    def __str__(self):
+        return f"{self.path}:{self.line_number}"
+
+
+class PreparedArticle:
+    """
+    One source file or bundle record after the parse stage: its article
+    data, source hash and StreamField data, or the error that stopped it, and
+    the seconds spent converting it.
+    """
+
+    def __init__(self, source, category_name, article_data=None, streamfield_data=None, source_hash=None,
+                 error=None, seconds=0.0):
+        self.source = source
+        self.category_name = category_name
+        self.article_data = article_data
+        self.streamfield_data = streamfield_data
+        self.source_hash = source_hash
+        self.error = error
+        self.seconds = seconds
+
+
+class StageStats:
+    """Items handled and seconds spent by one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.seconds = 0.0
+
+    def add(self, seconds, items=1):
+        self.items += items
+        self.seconds += seconds
+
+    def rate(self):
+        return self.items / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return f"{self.name}: {self.items} in {self.seconds:.1f}s ({self.rate():.1f}/s)"
+
+
+def init_worker():
+    # Pool processes started with "spawn" or "forkserver" need their own app
+    # registry; forked ones already have it.
+    from django.apps import apps
+
+    if not apps.ready:
+        import django
+
+        django.setup()
+
+
+def prepare_article(source, category_name):
+    """
+    Parse stage: read one article (a JSON file path or a JsonlRecord) and
+    build its StreamField data. A bundle record may name its own category in a
+    top-level "category" key. Pure CPU work with no database access, so it can
+    run in any process. Errors are returned rather than raised, so one bad
+    file or line doesn't stop the pipeline.
+    """
+    from knowledgebase.utils import generate_wagtail_streamfield_data
+
+    started = time.monotonic()
+    try:
+        if isinstance(source, JsonlRecord):
+            article_data = json.loads(source.text)
+            if not isinstance(article_data, dict):
+                raise ValueError("expected a JSON object")
+            category_name = article_data.pop('category', None) or category_name
+            if not category_name:
+                raise ValueError("no category (add a \"category\" key or pass --category-name)")
+        else:
+            with open(source, 'r') as f:
+                article_data = json.load(f)
+        streamfield_data = generate_wagtail_streamfield_data(article_data)
+    except FileNotFoundError:
+        return PreparedArticle(source, category_name, error=f"JSON file not found at {source}.")
+    except Exception as e:
+        return PreparedArticle(source, category_name, error=f"Error preparing {source}: {e}")
+    return PreparedArticle(
+        source, category_name, article_data, streamfield_data, compute_source_hash(article_data),
+        seconds=time.monotonic() - started,
+    )
+
+
+def is_jsonl_bundle(path):
+    suffixes = [suffix.lower() for suffix in path.suffixes]
+    if suffixes[-1:] == ['.gz']:
+        suffixes = suffixes[:-1]
+    return bool(suffixes) and suffixes[-1] in JSONL_SUFFIXES
+
+
+def iter_jsonl_records(path, start_offset=0, start_line=0):
+    """
+    Yield a JsonlRecord for each non-blank line of a JSONL/NDJSON bundle,
+    optionally gzip-compressed, reading one line at a time so memory doesn't
+    grow with the bundle. Reading resumes at start_offset (a byte offset in the
+    uncompressed stream, numbered from start_line), or after skipping
+    start_line lines when only that is given. Gzip streams can't seek, so a
+    resumed gzip bundle is decompressed up to the offset again.
+    """
+    opener = gzip.open if path.suffix.lower() == '.gz' else open
+    with opener(path, 'rb') as f:
+        line_number = start_line
+        if start_offset:
+            f.seek(start_offset)
+        else:
+            for _ in range(start_line):
+                if not f.readline():
+                    return
+        offset = start_offset or f.tell()
+        for line in f:
+            line_number += 1
+            end_offset = offset + len(line)
+            if line.strip():
+                yield JsonlRecord(str(path), line_number, offset, end_offset, line.decode('utf-8'))
+            offset = end_offset
+
+
+def iter_prepared_articles(entries, workers=1, max_pending=None):
+    """
+    Yield a PreparedArticle for each (source, category_name) entry, in
+    entry order. With more than one worker the files are parsed in a process
+    pool; at most max_pending (default 4 per worker) are in flight or waiting
+    for the consumer, so memory stays flat however many entries there are and
+    a slow writer holds back the parsers.
+    """
+    if workers <= 1:
+        for source, category_name in entries:
+            yield prepare_article(source, category_name)
+        return
+
+    max_pending = max(max_pending or workers * 4, workers)
+    entries = iter(entries)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        try:
+            for source, category_name in entries:
+                pending.append(pool.submit(prepare_article, source, category_name))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
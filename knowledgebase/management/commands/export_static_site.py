@@ -0,0 +1,29 @@
+# knowledgebase/management/commands/export_static_site.py
+
+from django.core.management.base import BaseCommand, CommandError
+from wagtail.models import Site
+from knowledgebase.static_export import brotli, export_site, get_export_root
+
+
+# python manage.py export_static_site --output-dir /srv/kb-static
+class Command(BaseCommand):
+    help = "Renders every live page of the default site to static HTML with .gz/.br siblings."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', type=str, help='Directory to write to. Defaults to STATIC_EXPORT_ROOT.')
+        parser.add_argument('--clear', action='store_true', help='Delete the output directory before exporting.')
+
+    def handle(self, *args, **options):
+        export_root = options['output_dir'] or get_export_root()
+        if not export_root:
+            raise CommandError("Pass --output-dir or set STATIC_EXPORT_ROOT.")
+
+        site = Site.objects.filter(is_default_site=True).first()
+        if not site:
+            raise CommandError("Default Wagtail site not found.")
+
+        if brotli is None:
+            self.stdout.write(self.style.WARNING("brotli is not installed; only .gz files will be written."))
+
+        exported = export_site(export_root, site=site, clear=options['clear'])
+        self.stdout.write(self.style.SUCCESS(f"Exported {exported} pages to {export_root}."))
@@ -0,0 +1,31 @@
+# knowledgebase/management/commands/generate_renditions.py
+
+from django.core.management.base import BaseCommand
+from wagtail.images import get_image_model
+from knowledgebase.renditions import generate_renditions_in_pool, get_rendition_specs
+
+
+# python manage.py generate_renditions --workers 4
+class Command(BaseCommand):
+    help = "Pre-generates the configured image renditions for the whole image library."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Number of worker threads (defaults to KB_RENDITION_WORKERS).')
+        parser.add_argument('--kind', type=str, default=None, help='Only generate specs for one kind, e.g. "article_image".')
+
+    def handle(self, *args, **options):
+        filter_specs = get_rendition_specs(options['kind'])
+        if not filter_specs:
+            self.stdout.write(self.style.WARNING("No rendition specs configured."))
+            return
+
+        image_ids = list(get_image_model().objects.values_list('pk', flat=True))
+        self.stdout.write(f"Generating {', '.join(filter_specs)} for {len(image_ids)} images...")
+
+        failed = 0
+        for image_id, error in generate_renditions_in_pool(image_ids, filter_specs, options['workers']):
+            if error is not None:
+                failed += 1
+                self.stderr.write(f"Image {image_id}: {error}")
+
+        self.stdout.write(self.style.SUCCESS(f"Generated renditions for {len(image_ids) - failed} images ({failed} failed)."))
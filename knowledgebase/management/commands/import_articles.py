@@ -4,6 +4,7 @@ from django.core.management.base import BaseCommand
 from wagtail.models import Page, Site
 from django.utils.text import slugify
 from knowledgebase.models import IndexPage, CategoryPage, ArticlePage
+from knowledgebase.import_pipeline import compute_source_hash
 from knowledgebase.utils import generate_wagtail_streamfield_data
 from wagtail.management.commands.fixtree import Command as FixTreeCommand
 from wagtail.images import get_image_model
@@ -15,48 +16,76 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--category-name', type=str, required=True, help='Name of the CategoryPage (e.g., "Bites", "Brain Health").')
         parser.add_argument('--json-path', type=str, required=True, help='Path to the JSON file containing article data.')
+        parser.add_argument('--force', action='store_true', help='Publish a new revision even if the JSON is unchanged since the last import.')
 
     def handle(self, *args, **kwargs):
         category_name = kwargs.get('category_name')
         json_path = kwargs.get('json_path')
 
+        article_data = self.load_article_data(json_path)
+        if article_data is None:
+            return
+
+        # Ensure the IndexPage exists
+        index_page = self.get_or_create_index_page()
+        index_page.refresh_from_db()
+
+        # Ensure the CategoryPage exists
+        category_page = self.get_or_create_category_page(index_page, category_name)
+        category_page.refresh_from_db()
+
+        self.import_article(category_page, article_data, force=kwargs.get('force', False))
+
+        # Validate tree integrity
+        self.stdout.write("Validating tree integrity...")
+
+        FixTreeCommand().handle()
+
+    def load_article_data(self, json_path):
+        """Read an article JSON file, or report why it can't be read and return None."""
         # Validate JSON file
         json_file = Path(json_path)
         if not json_file.is_file():
             self.stderr.write(f"JSON file not found at {json_path}.")
-            return
+            return None
 
         # Load JSON content
         try:
             with open(json_file, 'r') as f:
-                article_data = json.load(f)
+                return json.load(f)
         except json.JSONDecodeError as e:
             self.stderr.write(f"Error decoding JSON: {e}")
-            return
-
-        # Ensure the IndexPage exists
-        index_page = self.get_or_create_index_page()
-        index_page.refresh_from_db()
+            return None
+
+    def import_article(self, category_page, article_data, streamfield_data=None, source_hash=None, force=False):
+        """
+        Create or update the ArticlePage for article_data in a category, using
+        streamfield_data and source_hash if they were already generated. A live
+        article whose stored source hash matches is left alone (no revision,
+        publish signals or cache invalidation) unless force is set. Returns
+        "created", "updated", "unchanged" or "failed".
+        """
+        if source_hash is None:
+            source_hash = compute_source_hash(article_data)
 
-        # Ensure the CategoryPage exists
-        category_page = self.get_or_create_category_page(index_page, category_name)
-        category_page.refresh_from_db()
+        # Check for an existing article with the same title
+        existing_article = ArticlePage.objects.child_of(category_page).filter(title=article_data['title']).first()
+        if existing_article and existing_article.live and existing_article.source_hash == source_hash and not force:
+            self.stdout.write(f"Skipping unchanged article: {existing_article.title}")
+            return "unchanged"
 
         # Generate StreamField data for the article
-        streamfield_data = generate_wagtail_streamfield_data(article_data)
+        if streamfield_data is None:
+            streamfield_data = generate_wagtail_streamfield_data(article_data)
 
-        # Check for an existing article with the same title
-        existing_article = category_page.get_children().type(ArticlePage).filter(title=article_data['title']).first()
         if existing_article:
-            self.update_existing_article(existing_article, article_data, streamfield_data)
-        else:
-            # Create the new ArticlePage
-            self.create_article_page(category_page, article_data, streamfield_data)
+            self.update_existing_article(existing_article, article_data, streamfield_data, source_hash)
+            return "updated"
 
-        # Validate tree integrity
-        self.stdout.write("Validating tree integrity...")
-
-        FixTreeCommand().handle()
+        # Create the new ArticlePage
+        if self.create_article_page(category_page, article_data, streamfield_data, source_hash) is None:
+            return "failed"
+        return "created"
 
     def get_or_create_index_page(self):
         """Ensure that an IndexPage exists, or create it."""
@@ -95,7 +124,7 @@ class Command(BaseCommand):
 
         return category_page
     
-    def update_existing_article(self, article, article_data, streamfield_data):
+    def update_existing_article(self, article, article_data, streamfield_data, source_hash=None):
         """Update an existing ArticlePage with new data and publish a new revision."""
         self.stdout.write(f"Updating existing article: {article.title}")
 
@@ -125,6 +154,7 @@ class Command(BaseCommand):
 
         # Update the StreamField data (body)
         article.body = streamfield_data
+        article.source_hash = source_hash if source_hash is not None else compute_source_hash(article_data)
 
         # Publish a new revision using the specific instance
         article.specific.save_revision().publish()
@@ -154,8 +184,8 @@ class Command(BaseCommand):
         except Exception as e:
             self.stderr.write(f"Error deleting ArticlePage: {e}")
 
-    def create_article_page(self, category_page, article_data, streamfield_data):
-        """Create a new ArticlePage."""
+    def create_article_page(self, category_page, article_data, streamfield_data, source_hash=None):
+        """Create a new ArticlePage. Returns it, or None if it couldn't be created."""
         try:
             # Get the StreamField definition from the ArticlePage model
             body_field = ArticlePage._meta.get_field('body')
@@ -184,11 +214,14 @@ class Command(BaseCommand):
                 keywords=keywords,
                 article_image=article_image,
                 body=stream_value,
-                category=category_page
+                category=category_page,
+                source_hash=source_hash if source_hash is not None else compute_source_hash(article_data),
             )
 
             category_page.add_child(instance=article_page)
             article_page.save_revision().publish()
             self.stdout.write(f"Successfully imported article: {article_data['title']}")
+            return article_page
         except Exception as e:
-            self.stderr.write(f"Error creating ArticlePage: {e}")
\ No newline at end of file
+            self.stderr.write(f"Error creating ArticlePage: {e}")
+            return None
\ No newline at end of file
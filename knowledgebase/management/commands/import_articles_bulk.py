@@ -0,0 +1,233 @@
+# knowledgebase/management/commands/import_articles_bulk.py
+import csv
+import itertools
+import json
+import os
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+from django.core.management.base import CommandError
+from django.db import transaction
+from wagtail.management.commands.fixtree import Command as FixTreeCommand
+
+from base.batching import batched_page_signals
+from knowledgebase.import_pipeline import StageStats, is_jsonl_bundle, iter_jsonl_records, iter_prepared_articles
+from knowledgebase.management.commands.import_articles import Command as ImportArticlesCommand
+
+
+# python manage.py import_articles_bulk path/to/final_json
+# python manage.py import_articles_bulk manifest.csv --batch-size 100 --workers 4
+# python manage.py import_articles_bulk articles.jsonl.gz --checkpoint import.checkpoint --resume
+class Command(ImportArticlesCommand):
+    help = (
+        "Import many article JSON files in one process. SOURCE is a directory with one "
+        "subdirectory of JSON files per category, a JSON/CSV manifest mapping files to "
+        "category names, or a JSONL/NDJSON bundle (optionally gzipped) with one article "
+        "per line, which is streamed and can be resumed. Files are parsed and converted by --workers processes while a "
+        "single writer saves them in order, in batched transactions, and the page tree "
+        "is validated once at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', type=str, help='Directory of category subdirectories, a .json/.csv manifest, or a .jsonl/.ndjson(.gz) bundle.')
+        parser.add_argument('--category-name', type=str, default=None, help='Category for JSON files directly inside a SOURCE directory, or for bundle lines without a "category" key.')
+        parser.add_argument('--batch-size', type=int, default=50, help='Articles per transaction (default 50).')
+        parser.add_argument('--workers', type=int, default=1, help='Processes parsing and converting files (default 1: in this process).')
+        parser.add_argument('--max-pending', type=int, default=None, help='Parsed files allowed to wait for the writer (default 4 per worker).')
+        parser.add_argument('--force', action='store_true', help='Publish new revisions of articles whose JSON is unchanged since the last import.')
+        parser.add_argument('--defer-signals', action='store_true', help='Index and run publish receivers once per batch instead of once per article.')
+        parser.add_argument('--start-offset', type=int, default=0, help='Bundle only: start reading at this byte offset (of the uncompressed stream).')
+        parser.add_argument('--start-line', type=int, default=0, help='Bundle only: skip this many lines, or the line number of --start-offset.')
+        parser.add_argument('--checkpoint', type=str, default=None, help='Bundle only: file recording the resume point after each committed batch.')
+        parser.add_argument('--resume', action='store_true', help='Bundle only: continue from the --checkpoint file, if it exists.')
+        parser.add_argument('--skip-tree-check', action='store_true', help='Do not run fixtree at the end.')
+
+    def handle(self, *args, **options):
+        source = Path(options['source'])
+        batch_size = max(options['batch_size'], 1)
+        if is_jsonl_bundle(source):
+            entries = self.get_bundle_entries(source, options)
+            total = None
+            self.stdout.write(f"Streaming articles from {source} in batches of {batch_size}...")
+        else:
+            if options['start_offset'] or options['start_line'] or options['checkpoint'] or options['resume']:
+                raise CommandError("--start-offset, --start-line, --checkpoint and --resume only apply to JSONL bundles.")
+            entries = self.get_entries(source, options['category_name'])
+            total = len(entries)
+            self.stdout.write(f"Importing {total} articles in batches of {batch_size}...")
+
+        index_page = self.get_or_create_index_page()
+        if index_page is None:
+            raise CommandError("Default Wagtail site not found.")
+        index_page.refresh_from_db()
+
+        category_pages = {}
+        counts = {'created': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+        parse_stats = StageStats("Parse")
+        write_stats = StageStats("Write")
+        started = time.monotonic()
+
+        prepared_articles = iter_prepared_articles(entries, options['workers'], options['max_pending'])
+        done = 0
+        while batch := list(itertools.islice(prepared_articles, batch_size)):
+            write_started = time.monotonic()
+            # With --defer-signals, search indexing and the publish receivers
+            # run once for the whole batch after it commits.
+            with batched_page_signals() if options['defer_signals'] else nullcontext():
+                with transaction.atomic():
+                    for prepared in batch:
+                        parse_stats.add(prepared.seconds)
+                        counts[self.import_prepared(prepared, index_page, category_pages, options['force'])] += 1
+            write_stats.add(time.monotonic() - write_started, len(batch))
+            done += len(batch)
+            elapsed = time.monotonic() - started
+            progress = f"{done}/{total}" if total is not None else str(done)
+            self.stdout.write(f"{progress} articles processed ({elapsed:.1f}s, {done / elapsed:.1f}/s)")
+            if total is None:
+                self.save_checkpoint(source, batch[-1].source, options['checkpoint'])
+
+        if not options['skip_tree_check']:
+            self.stdout.write("Validating tree integrity...")
+            FixTreeCommand(stdout=self.stdout, stderr=self.stderr).handle()
+
+        # Parse seconds are summed over the workers, so with several workers
+        # the parse rate is per worker.
+        self.stdout.write(f"{parse_stats} across {max(options['workers'], 1)} worker(s); {write_stats}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['created']}, updated {counts['updated']}, unchanged {counts['unchanged']}, "
+            f"failed {counts['failed']} articles in {time.monotonic() - started:.1f}s."
+        ))
+
+    def import_prepared(self, prepared, index_page, category_pages, force=False):
+        """
+        Write one parsed file, creating its category on first use. Each article
+        gets its own savepoint, so a failure doesn't roll back the rest of the
+        batch.
+        """
+        if prepared.error is not None:
+            self.stderr.write(prepared.error)
+            return 'failed'
+
+        category_name = prepared.category_name
+        try:
+            with transaction.atomic():
+                if category_name not in category_pages:
+                    category_pages[category_name] = self.get_or_create_category_page(index_page, category_name)
+                return self.import_article(
+                    category_pages[category_name], prepared.article_data, prepared.streamfield_data,
+                    prepared.source_hash, force,
+                )
+        except Exception as e:
+            # The savepoint may have rolled back a category created for this file.
+            category_pages.pop(category_name, None)
+            index_page.refresh_from_db()
+            self.stderr.write(f"Error importing {prepared.source}: {e}")
+            return 'failed'
+
+    def get_bundle_entries(self, source, options):
+        """
+        Stream (record, default category) pairs from a JSONL bundle, starting
+        at the --checkpoint position with --resume, else at --start-offset or
+        --start-line.
+        """
+        if not source.is_file():
+            raise CommandError(f"Source not found at {source}.")
+        start_offset, start_line = options['start_offset'], options['start_line']
+
+        checkpoint = options['checkpoint']
+        if options['resume']:
+            if not checkpoint:
+                raise CommandError("--resume needs --checkpoint.")
+            if os.path.exists(checkpoint):
+                with open(checkpoint, 'r') as f:
+                    position = json.load(f)
+                if position['source'] != str(source.resolve()):
+                    raise CommandError(f"{checkpoint} records progress for {position['source']}, not {source}.")
+                start_offset, start_line = position['offset'], position['line']
+                self.stdout.write(f"Resuming after line {start_line} (byte {start_offset}).")
+
+        records = iter_jsonl_records(source, start_offset, start_line)
+        return ((record, options['category_name']) for record in records)
+
+    def save_checkpoint(self, source, last_record, checkpoint):
+        """
+        Record the position after the last line of a committed batch, so a
+        failed run can be resumed there with --resume (or --start-offset and
+        --start-line).
+        """
+        self.stdout.write(f"Committed through line {last_record.line_number} (next byte {last_record.end_offset}).")
+        if not checkpoint:
+            return
+        temporary = f"{checkpoint}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump({
+                'source': str(source.resolve()),
+                'line': last_record.line_number,
+                'offset': last_record.end_offset,
+            }, f)
+        os.replace(temporary, checkpoint)
+
+    def get_entries(self, source, default_category=None):
+        """Return the (json_path, category_name) pairs to import from SOURCE."""
+        if source.is_dir():
+            return self.get_directory_entries(source, default_category)
+        if not source.is_file():
+            raise CommandError(f"Source not found at {source}.")
+        if source.suffix.lower() == '.csv':
+            return self.get_csv_entries(source)
+        if source.suffix.lower() == '.json':
+            return self.get_json_entries(source)
+        raise CommandError(f"Unsupported manifest {source}: expected a .json or .csv file.")
+
+    def get_directory_entries(self, directory, default_category=None):
+        """
+        JSON files in each subdirectory are imported into the category named
+        after it; files directly inside the directory need --category-name.
+        """
+        entries = []
+        loose_files = sorted(directory.glob('*.json'))
+        if loose_files:
+            if not default_category:
+                raise CommandError(f"{directory} contains JSON files outside a category directory; pass --category-name.")
+            entries.extend((path, default_category) for path in loose_files)
+
+        for category_dir in sorted(path for path in directory.iterdir() if path.is_dir()):
+            entries.extend((path, category_dir.name) for path in sorted(category_dir.glob('*.json')))
+        return entries
+
+    def get_csv_entries(self, manifest):
+        """A CSV manifest has "path" and "category" columns."""
+        with open(manifest, newline='') as f:
+            reader = csv.DictReader(f)
+            if not reader.fieldnames or not {'path', 'category'} <= set(reader.fieldnames):
+                raise CommandError(f"{manifest} must have 'path' and 'category' columns.")
+            return [self.manifest_entry(manifest, row['path'], row['category']) for row in reader]
+
+    def get_json_entries(self, manifest):
+        """
+        A JSON manifest is a list of {"path": ..., "category": ...} objects, or an
+        object mapping category names to lists of paths.
+        """
+        try:
+            with open(manifest, 'r') as f:
+                data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise CommandError(f"Error decoding manifest {manifest}: {e}")
+
+        if isinstance(data, dict):
+            return [
+                self.manifest_entry(manifest, path, category)
+                for category, paths in data.items()
+                for path in paths
+            ]
+        try:
+            return [self.manifest_entry(manifest, item['path'], item['category']) for item in data]
+        except (KeyError, TypeError):
+            raise CommandError(f"{manifest} must list objects with 'path' and 'category' keys.")
+
+    def manifest_entry(self, manifest, path, category):
+        """Relative paths in a manifest are relative to the manifest itself."""
+        if not path or not category:
+            raise CommandError(f"{manifest} has an entry without a path or category.")
+        return manifest.parent / Path(path).expanduser(), category.strip()
@@ -0,0 +1,33 @@
+# knowledgebase/management/commands/rebuild_rendered_articles.py
+
+from django.core.management.base import BaseCommand, CommandError
+from knowledgebase.models import ArticlePage, ArticleRenderedContent
+from knowledgebase.templatetags.kb_tags import warm_rendered_article
+
+
+# python manage.py rebuild_rendered_articles
+class Command(BaseCommand):
+    help = "Re-renders every live ArticlePage into its ArticleRenderedContent row."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-id', type=int, action='append', dest='page_ids', help='Only rebuild the given ArticlePage id (may be repeated).')
+
+    def handle(self, *args, **options):
+        articles = ArticlePage.objects.live()
+        if options['page_ids']:
+            articles = articles.filter(pk__in=options['page_ids'])
+
+        rebuilt = 0
+        for article in articles.iterator():
+            try:
+                warm_rendered_article(article)
+            except Exception as e:
+                raise CommandError(f"Error rendering '{article.title}' (id {article.pk}): {e}")
+            rebuilt += 1
+
+        removed = 0
+        if not options['page_ids']:
+            # Rows for pages that are no longer live would never be read again.
+            removed, _ = ArticleRenderedContent.objects.exclude(page__live=True).delete()
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} rendered articles, removed {removed} stale rows."))
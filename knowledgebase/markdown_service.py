@@ -0,0 +1,87 @@
+# knowledgebase/markdown_service.py
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from markdown import Markdown
+
+DEFAULT_EXTENSIONS = ('extra', 'codehilite')
+
+_engines = threading.local()
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def get_cache_size():
+    return getattr(settings, 'KB_MARKDOWN_CACHE_SIZE', 1024)
+
+
+def get_engine(extensions=DEFAULT_EXTENSIONS):
+    """
+    Return this thread's Markdown instance for the given extensions, creating it
+    on first use. Loading extensions and Pygments lexers is the expensive part of
+    a conversion, so each thread keeps one engine per extension set.
+    """
+    engines = getattr(_engines, 'by_extensions', None)
+    if engines is None:
+        engines = _engines.by_extensions = {}
+
+    engine = engines.get(extensions)
+    if engine is None:
+        engine = engines[extensions] = Markdown(extensions=list(extensions))
+    return engine
+
+
+def convert_markdown(text, extensions=DEFAULT_EXTENSIONS):
+    """
+    Convert markdown to HTML, memoizing the output by a hash of the source text.
+    Imported articles repeat a lot of boilerplate, so identical blocks are only
+    converted once per process.
+    """
+    text = str(text)
+    extensions = tuple(extensions)
+    key = (extensions, hashlib.sha1(text.encode('utf-8')).hexdigest())
+
+    with _cache_lock:
+        html = _cache.get(key)
+        if html is not None:
+            _cache.move_to_end(key)
+            _stats['hits'] += 1
+            return html
+        _stats['misses'] += 1
+
+    engine = get_engine(extensions)
+    try:
+        html = engine.convert(text)
+    finally:
+        engine.reset()
+
+    with _cache_lock:
+        _cache[key] = html
+        _cache.move_to_end(key)
+        while len(_cache) > get_cache_size():
+            _cache.popitem(last=False)
+
+    return html
+
+
+def markdown_cache_info():
+    """
+    Return hit/miss counters and the current size of the conversion cache.
+    """
+    with _cache_lock:
+        return {
+            'hits': _stats['hits'],
+            'misses': _stats['misses'],
+            'size': len(_cache),
+            'max_size': get_cache_size(),
+        }
+
+
+def clear_markdown_cache():
+    with _cache_lock:
+        _cache.clear()
+        _stats['hits'] = 0
+        _stats['misses'] = 0
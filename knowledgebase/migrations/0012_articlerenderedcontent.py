@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-18 11:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledgebase', '0011_articlepage_article_image_articlepage_keywords_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleRenderedContent',
+            fields=[
+                ('page', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rendered_content', serialize=False, to='knowledgebase.articlepage')),
+                ('revision_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('renderer_version', models.PositiveIntegerField()),
+                ('body_html', models.TextField(blank=True)),
+                ('toc', models.JSONField(blank=True, default=list)),
+                ('plain_text', models.TextField(blank=True)),
+                ('word_count', models.PositiveIntegerField(default=0)),
+                ('rendered_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Rendered article content',
+                'verbose_name_plural': 'Rendered article content',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledgebase', '0012_articlerenderedcontent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='articlepage',
+            name='source_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Hash of the imported JSON this article was last written from, so unchanged re-imports are skipped.', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledgebase', '0013_articlepage_source_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reviewer',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
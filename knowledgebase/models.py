@@ -1,5 +1,16 @@
+import hashlib
+import html
+
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.cache import get_conditional_response
+from django.utils.html import strip_tags
+from django.utils.http import http_date, quote_etag
 from wagtail.models import Page
+from base.chrome import get_site_chrome
 from wagtail.admin.panels import FieldPanel, MultiFieldPanel
 from wagtail.fields import RichTextField, StreamField
 from wagtail import images
@@ -8,12 +19,66 @@ from .blocks import (
     BulletPointBlock, MarkdownBlock
 )
 from wagtail.search import index 
+from .pagination import paginate_by_title
+from .renditions import get_picture
+from .templatetags.kb_tags import RENDERER_VERSION, get_article_data
 # Reviewed metadata
 from wagtail.snippets.models import register_snippet 
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 
-class IndexPage(Page):
+class ConditionalGetMixin:
+    """
+    Answers If-None-Match / If-Modified-Since with a 304 before any template
+    rendering, and adds ETag / Last-Modified validators to full responses.
+    Pages describe what their output depends on via get_validator_parts.
+    """
+
+    def get_validator_parts(self):
+        """
+        Return (parts, last_modified): values that change whenever the rendered
+        page changes, and the latest publish time among them.
+        """
+        return [self.pk, self.live_revision_id], self.last_published_at
+
+    def get_validators(self, request):
+        """
+        The ETag and Last-Modified of the page as served: its own validator
+        parts plus the site chrome (footer and navigation) rendered around it.
+        """
+        parts, last_modified = self.get_validator_parts()
+        chrome = get_site_chrome(request)
+        if chrome:
+            parts = [*parts, sorted(chrome.items())]
+            last_modified = latest_published_at(last_modified, chrome['built_at'])
+        digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+        return quote_etag(digest), last_modified
+
+    def serve(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().serve(request, *args, **kwargs)
+
+        etag, last_modified = self.get_validators(request)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().serve(request, *args, **kwargs)
+
+        response.headers.setdefault('ETag', etag)
+        if last_modified is not None:
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+        return response
+
+
+INDEX_SUMMARY_CACHE_KEY = "kb:index-categories:{page_id}"
+
+
+def latest_published_at(*values):
+    published = [value for value in values if value]
+    return max(published) if published else None
+
+
+class IndexPage(ConditionalGetMixin, Page):
     subpage_types = ['knowledgebase.CategoryPage']
     max_count = 1  # Only one index page at root
 
@@ -24,15 +89,74 @@ class IndexPage(Page):
         Overriding the get_context method to modify the context.
         """
         context = super().get_context(request, *args, **kwargs)
+        context['categories'] = self.get_category_summaries()
+        return context
 
-        # Get live CategoryPage children and order them alphabetically by title
-        categories = CategoryPage.objects.live().child_of(self).order_by('title')
+    def get_category_summaries(self):
+        """
+        Live CategoryPage children ordered alphabetically by title, each with its
+        live article count and latest article publish date. Built from a single
+        annotated query and cached until an article or category below this
+        index is published, unpublished, moved or deleted.
+        """
+        cache_key = INDEX_SUMMARY_CACHE_KEY.format(page_id=self.pk)
+        summaries = cache.get(cache_key)
+        if summaries is None:
+            articles = (
+                ArticlePage.objects.live()
+                .filter(path__startswith=OuterRef('path'), depth=OuterRef('depth') + 1)
+                .order_by()
+                .values('depth')  # a single group: every child article
+            )
+            categories = (
+                CategoryPage.objects.live().child_of(self)
+                .order_by('title')
+                .annotate(
+                    article_count=Coalesce(
+                        Subquery(articles.annotate(count=Count('pk')).values('count')), 0
+                    ),
+                    last_updated=Subquery(
+                        articles.annotate(latest=Max('last_published_at')).values('latest')
+                    ),
+                )
+            )
+            summaries = [
+                {
+                    'id': category.pk,
+                    'title': category.title,
+                    'url': category.get_url(),
+                    'live_revision_id': category.live_revision_id,
+                    'last_published_at': category.last_published_at,
+                    'article_count': category.article_count,
+                    'last_updated': category.last_updated,
+                }
+                for category in categories
+            ]
+            cache.set(cache_key, summaries, timeout=None)
+        return summaries
 
-        context['categories'] = categories
-        return context
+    @classmethod
+    def invalidate_category_summaries(cls, page):
+        """
+        Drop the cached summaries of the index pages above the given page.
+        """
+        index_ids = page.get_ancestors(inclusive=True).type(cls).values_list('pk', flat=True)
+        cache.delete_many([INDEX_SUMMARY_CACHE_KEY.format(page_id=index_id) for index_id in index_ids])
 
+    def get_validator_parts(self):
+        summaries = self.get_category_summaries()
+        parts = [self.pk, self.live_revision_id] + [
+            (summary['id'], summary['live_revision_id'], summary['article_count'], summary['last_updated'])
+            for summary in summaries
+        ]
+        return parts, latest_published_at(
+            self.last_published_at,
+            *(summary['last_published_at'] for summary in summaries),
+            *(summary['last_updated'] for summary in summaries),
+        )
 
-class CategoryPage(Page):
+
+class CategoryPage(ConditionalGetMixin, Page):
     intro = RichTextField(blank=True)
     subpage_types = ['knowledgebase.ArticlePage']
 
@@ -46,12 +170,53 @@ class CategoryPage(Page):
         """
         context = super().get_context(request, *args, **kwargs)
 
-        # Get live ArticlePage children and order them alphabetically by title
-        articles = ArticlePage.objects.live().child_of(self).order_by('title')
-
+        if getattr(request, 'is_static_export', False):
+            # nginx ignores ?after= and the JSON endpoint isn't exported, so the
+            # static file lists every article and has no "Load more" link.
+            articles, next_cursor = list(self.get_article_cards()), None
+        else:
+            articles, next_cursor = self.get_article_page(request.GET.get('after'))
         context['articles'] = articles
+        context['next_cursor'] = next_cursor
         return context
 
+    def get_article_page(self, cursor=None):
+        """
+        Return (articles, next_cursor) for one page of article cards, seeking past
+        the (title, id) position in the cursor.
+        """
+        page_size = getattr(settings, 'KB_CATEGORY_PAGE_SIZE', 24)
+        return paginate_by_title(self.get_article_cards(), cursor, page_size)
+
+    def get_listed_articles(self):
+        """
+        Live ArticlePage children without a view restriction of their own; a
+        restricted article's title and intro aren't shown to everyone.
+        """
+        return ArticlePage.objects.live().child_of(self).filter(view_restrictions__isnull=True)
+
+    def get_article_cards(self):
+        """
+        Listed articles ordered alphabetically by title, loaded with card
+        images and their renditions prefetched. The StreamField
+        body isn't needed for cards, so it is deferred.
+        """
+        return (
+            self.get_listed_articles()
+            .order_by('title')
+            .defer('body')
+            .select_related('article_image')
+            .prefetch_related('article_image__renditions')
+        )
+
+    def get_validator_parts(self):
+        children = list(
+            self.get_listed_articles()
+            .values_list('pk', 'live_revision_id', 'last_published_at')
+        )
+        parts = [self.pk, self.live_revision_id] + [child[:2] for child in children]
+        return parts, latest_published_at(self.last_published_at, *(child[2] for child in children))
+
 
 @register_snippet
 class Reviewer(models.Model):
@@ -66,6 +231,7 @@ class Reviewer(models.Model):
         verbose_name=_("Photo")
     )
     bio = models.TextField(blank=True, verbose_name=_("Bio"))
+    updated_at = models.DateTimeField(auto_now=True, editable=False)
 
     panels = [
         FieldPanel('name'),
@@ -77,12 +243,18 @@ class Reviewer(models.Model):
     def __str__(self):
         return self.name
 
+    def get_photo_picture(self, **attrs):
+        """
+        Responsive rendition set of the reviewer's photo, or None without one.
+        """
+        return get_picture(self.photo, 'reviewer_photo', alt=self.name, **attrs)
+
     class Meta:
         verbose_name = _("Reviewer")
         verbose_name_plural = _("Reviewers")
 
 
-class ArticlePage(Page):
+class ArticlePage(ConditionalGetMixin, Page):
     reviewed = models.BooleanField(default=False, verbose_name=_("Reviewed"))
     reviewer = models.ForeignKey(
         Reviewer,
@@ -146,6 +318,13 @@ class ArticlePage(Page):
         help_text="The category this article belongs to."
     )
 
+    source_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        help_text="Hash of the imported JSON this article was last written from, so unchanged re-imports are skipped."
+    )
+
     content_panels = Page.content_panels + [
         MultiFieldPanel(
             [
@@ -170,8 +349,36 @@ class ArticlePage(Page):
         index.RelatedFields('category', [  # Include the category's title
             index.SearchField('title'),
         ]),
+        index.FilterField('category'),  # Category filter and facets in article search
     ]
 
+    def get_validator_parts(self):
+        # The reviewer box shows the reviewer's name, credentials, photo and bio.
+        reviewer_updated_at = self.reviewer.updated_at if self.reviewer_id else None
+        parts = [self.pk, self.live_revision_id, self.reviewer_id, reviewer_updated_at, RENDERER_VERSION]
+        return parts, latest_published_at(self.last_published_at, reviewer_updated_at)
+
+    def get_cache_tags(self):
+        """
+        Extra page cache tags: the reviewer box changes when the reviewer is edited.
+        """
+        return {f"reviewer:{self.reviewer_id}"} if self.reviewer_id else set()
+
+    def get_image_picture(self, **attrs):
+        """
+        Responsive rendition set of the article image, or None without one.
+        """
+        return get_picture(self.article_image, 'article_image', alt=self.title, **attrs)
+
+    def get_context(self, request, *args, **kwargs):
+        """
+        Render the article body and TOC once per request so the content and
+        sidebar blocks of the template share the same article_data.
+        """
+        context = super().get_context(request, *args, **kwargs)
+        context['article_data'] = get_article_data(self, request)
+        return context
+
     def save(self, *args, **kwargs):
         """
         Override the save method to update the review_date.
@@ -184,4 +391,50 @@ class ArticlePage(Page):
         elif self.reviewed == False:
             self.review_date = None
 
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class ArticleRenderedContent(models.Model):
+    """
+    Pre-rendered body HTML and TOC for an ArticlePage, rebuilt on publish so that
+    article views read a single row instead of rendering the StreamField.
+    """
+    page = models.OneToOneField(
+        ArticlePage,
+        primary_key=True,
+        on_delete=models.CASCADE,
+        related_name='rendered_content',
+    )
+    revision_id = models.PositiveIntegerField(null=True, blank=True)
+    renderer_version = models.PositiveIntegerField()
+    body_html = models.TextField(blank=True)
+    toc = models.JSONField(default=list, blank=True)
+    plain_text = models.TextField(blank=True)
+    word_count = models.PositiveIntegerField(default=0)
+    rendered_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _("Rendered article content")
+        verbose_name_plural = _("Rendered article content")
+
+    def __str__(self):
+        return f"Rendered content for page {self.page_id}"
+
+    @classmethod
+    def store(cls, page, html_content, toc, renderer_version):
+        """
+        Create or replace the rendered row for a page.
+        """
+        plain_text = " ".join(html.unescape(strip_tags(html_content)).split())
+        rendered, _created = cls.objects.update_or_create(
+            page_id=page.pk,
+            defaults={
+                'revision_id': page.live_revision_id,
+                'renderer_version': renderer_version,
+                'body_html': html_content,
+                'toc': toc,
+                'plain_text': plain_text,
+                'word_count': len(plain_text.split()),
+            },
+        )
+        return rendered
@@ -0,0 +1,50 @@
+# knowledgebase/pagination.py
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+
+
+def encode_cursor(title, pk):
+    """
+    Encode a (title, id) position as an opaque, URL-safe cursor.
+    """
+    payload = json.dumps([title, pk], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor, or return None if it is invalid.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        title, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        return None
+    if not isinstance(title, str) or not isinstance(pk, int):
+        return None
+    return title, pk
+
+
+def paginate_by_title(queryset, cursor=None, page_size=24):
+    """
+    Return (items, next_cursor) for the page of a queryset that follows the
+    cursor, ordered by (title, id). Seeking past the cursor with a WHERE clause
+    keeps every page as cheap as the first, unlike OFFSET.
+    """
+    position = decode_cursor(cursor)
+    queryset = queryset.order_by('title', 'pk')
+    if position is not None:
+        title, pk = position
+        queryset = queryset.filter(Q(title__gt=title) | Q(title=title, pk__gt=pk))
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(items[-1].title, items[-1].pk)
+    return items, next_cursor
@@ -0,0 +1,174 @@
+# knowledgebase/renditions.py
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from wagtail.images import get_image_model
+from wagtail.images.models import Picture
+
+logger = logging.getLogger(__name__)
+
+# Responsive rendition sets the templates use, by the kind of image. Each set is
+# cropped to one aspect ratio at several widths, in every format of
+# RENDITION_FORMATS, so browsers pick the smallest file that fits the layout.
+# Override with KB_RENDITION_SETS.
+DEFAULT_RENDITION_SETS = {
+    'article_image': {
+        'aspect_ratio': (4, 3),
+        'widths': [320, 480, 800],
+        'sizes': '(min-width: 768px) 33vw, 100vw',
+    },
+    'reviewer_photo': {
+        'aspect_ratio': (1, 1),
+        'widths': [100, 200],
+        'sizes': '100px',
+    },
+}
+
+# Preferred format first; the last one is the <img> fallback.
+RENDITION_FORMATS = ('webp', 'jpeg')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_rendition_set(kind):
+    rendition_sets = getattr(settings, 'KB_RENDITION_SETS', DEFAULT_RENDITION_SETS)
+    return rendition_sets[kind]
+
+
+def get_rendition_specs(kind=None):
+    """
+    Return the filter specs of one kind's rendition set, or of every set when
+    kind is None.
+    """
+    if kind is None:
+        rendition_sets = getattr(settings, 'KB_RENDITION_SETS', DEFAULT_RENDITION_SETS)
+        return list(dict.fromkeys(spec for name in rendition_sets for spec in get_rendition_specs(name)))
+
+    rendition_set = get_rendition_set(kind)
+    ratio_width, ratio_height = rendition_set['aspect_ratio']
+    return [
+        f"fill-{width}x{round(width * ratio_height / ratio_width)}|format-{fmt}"
+        for fmt in RENDITION_FORMATS
+        for width in rendition_set['widths']
+    ]
+
+
+def get_picture(image, kind, **attrs):
+    """
+    Return a wagtail Picture (rendered as <picture> with a WebP <source> and a
+    JPEG <img> fallback) for an image's rendition set, or None without an image.
+    Every rendition in the set is looked up with one query (none when the image's
+    renditions are prefetched) and any missing ones are created together. The
+    <img> is lazy-loaded and carries the intrinsic width and height.
+    """
+    if image is None:
+        return None
+    attrs = {'loading': 'lazy', 'decoding': 'async', 'sizes': get_rendition_set(kind)['sizes'], **attrs}
+    return Picture(image.get_renditions(*get_rendition_specs(kind)), attrs)
+
+
+def serialize_picture(picture):
+    """
+    Plain-data form of a Picture for JSON responses: the fallback image plus the
+    srcset of each format.
+    """
+    fallback_format = picture.get_fallback_format()
+    fallback = picture.formats[fallback_format][0] if fallback_format else picture.renditions[0]
+    return {
+        'url': fallback.url,
+        'width': fallback.width,
+        'height': fallback.height,
+        'sizes': picture.attrs.get('sizes', ''),
+        'sources': [
+            {'type': fmt.mime_type, 'srcset': picture.get_width_srcset(picture.formats[fmt.name])}
+            for fmt in picture.source_format_order
+            if fmt.name in picture.formats
+        ],
+    }
+
+
+def get_worker_count():
+    return getattr(settings, 'KB_RENDITION_WORKERS', 2)
+
+
+def generate_renditions(image_id, filter_specs):
+    """
+    Create any missing renditions of one image. Existing renditions are found
+    with a single query, so calling this for an up-to-date image is cheap.
+    Returns the number of renditions requested.
+    """
+    if not filter_specs:
+        return 0
+    close_old_connections()
+    try:
+        image = get_image_model().objects.filter(pk=image_id).first()
+        if image is None:
+            return 0
+        image.get_renditions(*filter_specs)
+        return len(filter_specs)
+    except Exception:
+        logger.exception("Could not generate renditions %s for image %s", filter_specs, image_id)
+        raise
+    finally:
+        # Worker threads hold their own connection; don't leave it open.
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+
+
+def generate_renditions_in_pool(image_ids, filter_specs, max_workers=None):
+    """
+    Generate renditions for many images in a thread pool (Pillow releases the
+    GIL while resizing). Yields (image_id, error) as each image finishes. With a
+    single worker the images are processed in the calling thread.
+    """
+    max_workers = max_workers or get_worker_count()
+    if max_workers <= 1:
+        for image_id in image_ids:
+            try:
+                generate_renditions(image_id, filter_specs)
+            except Exception as e:
+                yield image_id, e
+            else:
+                yield image_id, None
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(generate_renditions, image_id, filter_specs): image_id
+            for image_id in image_ids
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.exception()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_worker_count(), thread_name_prefix='renditions'
+            )
+        return _executor
+
+
+def schedule_renditions(image_id, filter_specs):
+    """
+    Generate renditions for an image in the background once the current
+    transaction commits, so the request that uploaded or assigned it doesn't
+    pay for image processing. Set KB_RENDITIONS_ASYNC = False to generate them
+    synchronously on commit instead.
+    """
+    if not image_id or not filter_specs:
+        return
+
+    def run():
+        if getattr(settings, 'KB_RENDITIONS_ASYNC', True):
+            get_executor().submit(generate_renditions, image_id, filter_specs)
+        else:
+            generate_renditions(image_id, filter_specs)
+
+    transaction.on_commit(run)
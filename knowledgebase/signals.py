@@ -0,0 +1,237 @@
+# knowledgebase/signals.py
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from wagtail.signals import page_published, page_unpublished, post_page_move
+
+from wagtail.images import get_image_model
+from wagtail.models import Page, PageViewRestriction
+
+from base import batching
+from base.page_cache import invalidate_tags
+
+from . import renditions, static_export, typeahead
+from .models import ArticlePage, CategoryPage, IndexPage, Reviewer
+from .templatetags.kb_tags import invalidate_rendered_article, warm_rendered_article
+
+
+@receiver(page_published, sender=ArticlePage)
+@batching.deferred_in_batch
+def warm_article_render_cache(sender, instance, **kwargs):
+    """
+    Pre-render a freshly published (or reverted and re-published) article so the
+    first anonymous view is a cache hit.
+    """
+    warm_rendered_article(instance)
+
+
+@receiver(page_unpublished, sender=ArticlePage)
+@receiver(post_delete, sender=ArticlePage)
+@batching.deferred_in_batch
+def drop_article_render_cache(sender, instance, **kwargs):
+    """
+    Remove the cached and stored render of an article that is no longer live.
+    """
+    invalidate_rendered_article(instance.pk)
+
+
+@receiver(page_published, sender=ArticlePage)
+@receiver(page_published, sender=CategoryPage)
+@receiver(page_unpublished, sender=ArticlePage)
+@receiver(page_unpublished, sender=CategoryPage)
+@receiver(post_page_move, sender=ArticlePage)
+@receiver(post_page_move, sender=CategoryPage)
+@receiver(post_delete, sender=ArticlePage)
+@receiver(post_delete, sender=CategoryPage)
+@batching.deferred_in_batch
+def drop_index_category_summaries(sender, instance, **kwargs):
+    """
+    Article counts and last-updated dates on the index change with any article
+    or category below it.
+    """
+    IndexPage.invalidate_category_summaries(instance)
+    if 'parent_page_before' in kwargs:
+        IndexPage.invalidate_category_summaries(kwargs['parent_page_before'])
+
+
+@receiver(page_published)
+@batching.deferred_in_batch
+def export_published_page(sender, instance, **kwargs):
+    """
+    Re-export a published page and the index/category pages that list it, when
+    STATIC_EXPORT_ROOT is configured.
+    """
+    export_root = static_export.get_export_root()
+    if export_root is None:
+        return
+    if static_export.has_moved(instance, export_root):
+        # A new slug changes the URL of every page below it too.
+        static_export.export_subtree(instance, export_root)
+    for page in static_export.get_affected_pages(instance):
+        static_export.export_page(page, export_root)
+
+
+@receiver(page_unpublished)
+@batching.deferred_in_batch
+def remove_unpublished_page(sender, instance, **kwargs):
+    """
+    Remove an unpublished page's exported files and re-export the pages that
+    listed it, when STATIC_EXPORT_ROOT is configured.
+    """
+    export_root = static_export.get_export_root()
+    if export_root is None:
+        return
+    static_export.remove_page(instance, export_root)
+    for page in static_export.get_affected_pages(instance)[1:]:
+        static_export.export_page(page, export_root)
+
+
+@receiver(post_page_move)
+def export_moved_pages(sender, instance, parent_page_before, **kwargs):
+    """
+    Re-export a moved page and its subtree at their new URLs (removing the old
+    files), and the index/category pages that list it before and after.
+    """
+    export_root = static_export.get_export_root()
+    if export_root is None:
+        return
+    static_export.export_subtree(instance, export_root)
+    affected_pages = static_export.get_affected_pages(instance)[1:] + static_export.get_affected_pages(parent_page_before)
+    for page in {page.pk: page for page in affected_pages}.values():
+        if page.live:
+            static_export.export_page(page, export_root)
+
+
+@receiver(post_delete, sender=Page)
+def remove_deleted_page(sender, instance, **kwargs):
+    """
+    Remove a deleted page's exported files and re-export the pages that
+    listed it. Deleting a subtree sends this for every page in it.
+    """
+    export_root = static_export.get_export_root()
+    if export_root is None:
+        return
+    static_export.remove_exported(instance.pk, export_root)
+    for page in static_export.get_affected_pages(instance)[1:]:
+        static_export.export_page(page, export_root)
+
+
+@receiver(post_save, sender=PageViewRestriction)
+def remove_restricted_pages(sender, instance, **kwargs):
+    """
+    Delete the exported files of a page (and its subtree) once a view
+    restriction is put on it, so nginx stops serving them to everyone.
+    """
+    export_root = static_export.get_export_root()
+    if export_root is not None:
+        static_export.remove_subtree(instance.page, export_root)
+
+
+@receiver(post_delete, sender=PageViewRestriction)
+def export_unrestricted_pages(sender, instance, **kwargs):
+    export_root = static_export.get_export_root()
+    if export_root is not None:
+        static_export.export_subtree(instance.page, export_root)
+
+
+@receiver(post_save, sender=PageViewRestriction)
+@receiver(post_delete, sender=PageViewRestriction)
+def refresh_typeahead_visibility(sender, instance, **kwargs):
+    # Workers reload the public page ids, hiding or showing the subtree.
+    typeahead.bump_generation()
+
+
+@receiver(post_save, sender=Reviewer)
+def invalidate_reviewer_pages(sender, instance, **kwargs):
+    """
+    Drop cached responses of the articles showing this reviewer.
+    """
+    invalidate_tags([f"reviewer:{instance.pk}"])
+
+
+@receiver(post_save, sender=get_image_model())
+def pregenerate_uploaded_image_renditions(sender, instance, created, **kwargs):
+    """
+    Build every configured rendition of a newly uploaded image in the background.
+    """
+    if created:
+        renditions.schedule_renditions(instance.pk, renditions.get_rendition_specs())
+
+
+@receiver(page_published, sender=ArticlePage)
+def pregenerate_article_image_renditions(sender, instance, **kwargs):
+    renditions.schedule_renditions(
+        instance.article_image_id, renditions.get_rendition_specs('article_image')
+    )
+
+
+@receiver(post_save, sender=Reviewer)
+def pregenerate_reviewer_photo_renditions(sender, instance, **kwargs):
+    renditions.schedule_renditions(
+        instance.photo_id, renditions.get_rendition_specs('reviewer_photo')
+    )
+
+
+@receiver(page_published, sender=ArticlePage)
+@receiver(page_published, sender=CategoryPage)
+@receiver(page_unpublished, sender=ArticlePage)
+@receiver(page_unpublished, sender=CategoryPage)
+@batching.deferred_in_batch
+def update_typeahead_entries(sender, instance, **kwargs):
+    """
+    Refresh the page's typeahead entries, and its category's (whose ranking
+    counts its live articles).
+    """
+    typeahead.update_page(instance)
+    parent = instance.get_parent().specific
+    if isinstance(parent, CategoryPage) and parent.live:
+        typeahead.update_page(parent)
+
+
+@receiver(post_page_move, sender=ArticlePage)
+@receiver(post_page_move, sender=CategoryPage)
+def rebuild_typeahead_entries(sender, instance, **kwargs):
+    # A move changes the URLs of the whole subtree and two categories' counts.
+    typeahead.rebuild()
+
+
+@receiver(post_delete, sender=ArticlePage)
+@receiver(post_delete, sender=CategoryPage)
+def remove_typeahead_entries(sender, instance, **kwargs):
+    typeahead.remove_page(instance.pk)
+
+
+@batching.on_flush
+def apply_deferred_page_receivers(pages):
+    """
+    Do the work of the deferred receivers above once for a batch of published
+    or unpublished pages: one typeahead rebuild, one summary invalidation per
+    category and one export of each affected page.
+    """
+    for page in pages:
+        if isinstance(page, ArticlePage):
+            if page.live:
+                warm_rendered_article(page)
+            else:
+                invalidate_rendered_article(page.pk)
+
+    parents = {page.path[:-page.steplen]: page for page in pages}
+    for page in parents.values():
+        IndexPage.invalidate_category_summaries(page)
+
+    export_root = static_export.get_export_root()
+    if export_root is not None:
+        affected_pages = {}
+        for page in pages:
+            if page.live:
+                if static_export.has_moved(page, export_root):
+                    static_export.export_subtree(page, export_root)
+                affected = static_export.get_affected_pages(page)
+            else:
+                static_export.remove_page(page, export_root)
+                affected = static_export.get_affected_pages(page)[1:]
+            affected_pages.update((affected_page.pk, affected_page) for affected_page in affected)
+        for page in affected_pages.values():
+            static_export.export_page(page, export_root)
+
+    if any(isinstance(page, (ArticlePage, CategoryPage)) for page in pages):
+        typeahead.rebuild()
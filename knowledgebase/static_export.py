@@ -0,0 +1,218 @@
+# knowledgebase/static_export.py
+import gzip
+import logging
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+from wagtail.models import Site
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; only .gz siblings are written without it.
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Each exported page's URL path is recorded in <export root>/.pages/<page id>,
+# so its files can be found and removed after its URL changes or it is deleted.
+RECORD_DIR = '.pages'
+
+
+def get_export_root():
+    """
+    Directory the publish hooks export into, or None when static export is off.
+    """
+    export_root = getattr(settings, 'STATIC_EXPORT_ROOT', None)
+    return Path(export_root) if export_root else None
+
+
+def build_request(site, path):
+    """
+    Build an anonymous GET request for a path on the given site.
+    """
+    host = site.hostname if site.port in (80, 443) else f"{site.hostname}:{site.port}"
+    request = RequestFactory().get(path, HTTP_HOST=host, SERVER_NAME=site.hostname)
+    request.user = AnonymousUser()
+    # Pages that paginate for browsers render everything for the export.
+    request.is_static_export = True
+    return request
+
+
+def get_page_path(page, site):
+    """
+    Return the page's URL path on the site (e.g. '/index/allergies/'), or None if
+    the page isn't routable there.
+    """
+    url_parts = page.get_url_parts()
+    if url_parts is None:
+        return None
+    site_id, root_url, page_path = url_parts
+    if site_id != site.pk:
+        return None
+    return page_path
+
+
+def get_output_path(export_root, page_path):
+    return Path(export_root) / page_path.strip('/') / 'index.html'
+
+
+def get_record_path(export_root, page_id):
+    return Path(export_root) / RECORD_DIR / str(page_id)
+
+
+def get_exported_path(page_id, export_root):
+    """
+    Return the URL path a page was last exported to, or None if it has no
+    exported files.
+    """
+    try:
+        return get_record_path(export_root, page_id).read_text()
+    except FileNotFoundError:
+        return None
+
+
+def record_exported_path(page_id, export_root, page_path):
+    record_path = get_record_path(export_root, page_id)
+    record_path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = Path(f"{record_path}.tmp")
+    temporary.write_text(page_path)
+    temporary.replace(record_path)
+
+
+def remove_files(export_root, page_path):
+    output_path = get_output_path(export_root, page_path)
+    for path in (output_path, Path(f"{output_path}.gz"), Path(f"{output_path}.br")):
+        path.unlink(missing_ok=True)
+
+
+def has_moved(page, export_root, site=None):
+    """
+    Whether the page was exported under a different URL path than its current
+    one, i.e. its slug changed or it was moved since, so its descendants' URLs
+    changed too.
+    """
+    site = site or Site.objects.filter(is_default_site=True).first()
+    exported_path = get_exported_path(page.pk, export_root)
+    return exported_path is not None and exported_path != get_page_path(page, site)
+
+
+def write_file(path, content):
+    """
+    Write content plus precompressed .gz (and .br when available) siblings.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    # mtime=0 keeps the gzip output stable so unchanged pages produce identical files.
+    Path(f"{path}.gz").write_bytes(gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        Path(f"{path}.br").write_bytes(brotli.compress(content))
+
+
+def export_page(page, export_root, site=None):
+    """
+    Render a live page as an anonymous visitor would see it and write it under
+    export_root. Returns the written path, or None if the page wasn't exported
+    (not live, not routable or view-restricted).
+    """
+    site = site or Site.objects.filter(is_default_site=True).first()
+    page = page.specific
+    page_path = get_page_path(page, site)
+    if not page.live or page_path is None:
+        return None
+
+    # page.serve() skips the before_serve_page hooks that enforce password,
+    # login and group restrictions (own or inherited), and nginx would serve
+    # the file to anyone, so restricted pages are never exported.
+    if page.get_view_restrictions().exists():
+        remove_page(page, export_root, site=site)
+        return None
+
+    request = build_request(site, page_path)
+    response = page.serve(request)
+    if hasattr(response, 'render'):
+        response.render()
+    if response.status_code != 200:
+        logger.warning("Skipping export of %s: status %s", page_path, response.status_code)
+        return None
+
+    exported_path = get_exported_path(page.pk, export_root)
+    if exported_path is not None and exported_path != page_path:
+        remove_files(export_root, exported_path)
+    output_path = get_output_path(export_root, page_path)
+    write_file(output_path, response.content)
+    record_exported_path(page.pk, export_root, page_path)
+    return output_path
+
+
+def remove_page(page, export_root, site=None):
+    """
+    Remove a page's exported files (but not those of its descendants), both
+    at its current URL path and at the one it was last exported to.
+    """
+    site = site or Site.objects.filter(is_default_site=True).first()
+    page_path = get_page_path(page, site)
+    if page_path is not None:
+        remove_files(export_root, page_path)
+    remove_exported(page.pk, export_root)
+
+
+def remove_exported(page_id, export_root):
+    """
+    Remove the files a page was last exported to, e.g. after it was deleted.
+    """
+    exported_path = get_exported_path(page_id, export_root)
+    if exported_path is not None:
+        remove_files(export_root, exported_path)
+        get_record_path(export_root, page_id).unlink(missing_ok=True)
+
+
+def remove_subtree(page, export_root, site=None):
+    """
+    Remove the exported files of a page and all its descendants, e.g. when a
+    view restriction is added to it.
+    """
+    site = site or Site.objects.filter(is_default_site=True).first()
+    for descendant in page.get_descendants(inclusive=True):
+        remove_page(descendant, export_root, site=site)
+
+
+def export_subtree(page, export_root, site=None):
+    """
+    Export a page and all its live descendants, e.g. when a view restriction is
+    removed from it or its URL changed. Pages still restricted by another
+    restriction are skipped; files left at old URL paths are removed.
+    """
+    site = site or Site.objects.filter(is_default_site=True).first()
+    for descendant in page.get_descendants(inclusive=True).live().specific():
+        export_page(descendant, export_root, site=site)
+
+
+def export_site(export_root, site=None, clear=False):
+    """
+    Export every live page under the site's root page. Returns the number of
+    pages written.
+    """
+    site = site or Site.objects.filter(is_default_site=True).first()
+    export_root = Path(export_root)
+    if clear and export_root.exists():
+        shutil.rmtree(export_root)
+
+    exported = 0
+    for page in site.root_page.get_descendants(inclusive=True).live().specific():
+        if export_page(page, export_root, site=site):
+            exported += 1
+    return exported
+
+
+def get_affected_pages(page):
+    """
+    Pages whose output changes when the given page is published or unpublished:
+    the page itself plus its live index/category ancestors.
+    """
+    from knowledgebase.models import CategoryPage, IndexPage
+
+    ancestors = page.get_ancestors().live().type(IndexPage, CategoryPage).specific()
+    return [page, *ancestors]
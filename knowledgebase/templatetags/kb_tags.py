@@ -1,180 +1,424 @@
 # knowledgebase/templatetags/kb_tags.py
+import hashlib
+import json
 import logging
 import re
 import uuid
 from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils.html import format_html
 from django.template.defaultfilters import slugify
-from markdown import Markdown
+from base import singleflight
+from knowledgebase.markdown_service import convert_markdown
+from knowledgebase.renditions import get_picture
 
 logger = logging.getLogger(__name__)
 
 register = template.Library()
 
+# Bump whenever the HTML produced by generate_article_html_and_toc changes,
+# so cached renders from an older renderer are never served.
+RENDERER_VERSION = 1
+
+RENDER_CACHE_KEY = "kb:article-render:{page_id}"
+RENDER_FLIGHT_KEY = "kb:article-render:{page_id}:{revision_id}"
+FRAGMENT_CACHE_KEY = "kb:article-fragment:{version}:{block_type}:{block_id}:{content_hash}:{references_digest}"
+
+# Headings are cheap and depend on the headings before them (ID de-duplication
+# and TOC nesting), so only self-contained blocks are fragment-cached. Blocks
+# without an id (bodies that were never saved) are always rendered.
+CACHEABLE_BLOCK_TYPES = {"markdown", "rich_text", "bullet_points", "key_facts", "faqs", "references"}
+
+BOLD_PATTERN = re.compile(r'\*\*(.+?)\*\*')
+ITALIC_PATTERN = re.compile(r'\*(.+?)\*')
+
+# Regular expression to find citations like [1] or [1, 2]
+CITATION_PATTERN = re.compile(r'\[([\d,\s]+)\]')
+
+
 @register.filter
 def split(value, delimiter=","):
     if not value:
         return []
     return [v.strip() for v in value.split(delimiter)]
 
+@register.simple_tag
+def rendition_set(image, kind, **attrs):
+    """
+    Render an image's responsive rendition set as a lazy-loaded <picture>, e.g.
+    {% rendition_set article.article_image "article_image" alt=article.title %}
+    """
+    return get_picture(image, kind, **attrs) or ""
+
 @register.simple_tag(takes_context=True)
 def render_article_content(context, page):
     """
     Process RichText content from the page's fields to extract the table of contents (TOC),
     add internal links for citations, and return a dictionary with both TOC and body content
-    to the template.
+    to the template. ArticlePage.get_context already provides article_data, so this tag
+    is only needed by templates rendered outside the page's own context.
     """
-    html_content, toc = generate_article_html_and_toc(page.body)
+    context['article_data'] = get_article_data(page, context.get('request'))
+    return ""
+
+
+def get_article_data(page, request=None):
+    """
+    Return the {'toc', 'body'} dictionary used by article templates. The result is
+    memoized on the request, so the content and sidebar blocks share one render.
+    """
+    memo = getattr(request, '_kb_article_data', None) if request is not None else None
+    if memo is not None and page.pk in memo:
+        return memo[page.pk]
 
-    context['article_data'] = {
+    use_cache = not getattr(request, 'is_preview', False)
+    html_content, toc = get_rendered_article(page, use_cache=use_cache)
+
+    article_data = {
         'toc': toc,
         'body': format_html(html_content),
     }
 
-    return ""
+    if request is not None:
+        if memo is None:
+            memo = request._kb_article_data = {}
+        memo[page.pk] = article_data
+
+    return article_data
+
+
+def render_cache_key(page_id):
+    return RENDER_CACHE_KEY.format(page_id=page_id)
+
+
+def get_rendered_article(page, use_cache=True):
+    """
+    Return the (html_content, toc) pair for an ArticlePage. Lookups go through the
+    render cache, then the ArticleRenderedContent row, and only render the
+    StreamField when neither matches the page's live revision and the current
+    renderer version. Misses are rendered and written back to both.
+    """
+    if not use_cache:
+        return generate_article_html_and_toc(page.body)
+
+    cached = get_cached_render(page)
+    if cached is not None:
+        return cached
+
+    from knowledgebase.models import ArticleRenderedContent
+
+    rendered = ArticleRenderedContent.objects.filter(
+        page_id=page.pk,
+        revision_id=page.live_revision_id,
+        renderer_version=RENDERER_VERSION,
+    ).only('body_html', 'toc').first()
+    if rendered:
+        cache_rendered_article(page, rendered.body_html, rendered.toc)
+        return rendered.body_html, rendered.toc
+
+    def render_and_store():
+        html_content, toc = generate_article_html_and_toc(page.body)
+        store_rendered_article(page, html_content, toc)
+        return html_content, toc
+
+    # Requests that miss together (e.g. a popular article just published)
+    # share one render instead of each rendering the StreamField.
+    return singleflight.coalesce(
+        RENDER_FLIGHT_KEY.format(page_id=page.pk, revision_id=page.live_revision_id),
+        render_and_store,
+        lambda: get_cached_render(page),
+    )
+
+
+def get_cached_render(page):
+    """
+    Return the cached (html_content, toc) pair for an article if it matches the
+    page's live revision and the current renderer version, else None.
+    """
+    cached = cache.get(render_cache_key(page.pk))
+    if (
+        cached
+        and cached['revision_id'] == page.live_revision_id
+        and cached['version'] == RENDERER_VERSION
+    ):
+        return cached['body'], cached['toc']
+    return None
+
+
+def cache_rendered_article(page, html_content, toc):
+    """
+    Write a rendered article to the render cache. Entries never expire on their
+    own; they are replaced on publish and dropped by invalidate_rendered_article.
+    """
+    cache.set(
+        render_cache_key(page.pk),
+        {
+            'revision_id': page.live_revision_id,
+            'version': RENDERER_VERSION,
+            'body': html_content,
+            'toc': toc,
+        },
+        timeout=None,
+    )
+
+
+def store_rendered_article(page, html_content, toc):
+    """
+    Persist a rendered article to its ArticleRenderedContent row and the cache.
+    """
+    from knowledgebase.models import ArticleRenderedContent
+
+    ArticleRenderedContent.store(page, html_content, toc, RENDERER_VERSION)
+    cache_rendered_article(page, html_content, toc)
+
+
+def warm_rendered_article(page):
+    """
+    Render an article and store the result, e.g. right after publish.
+    """
+    html_content, toc = generate_article_html_and_toc(page.body)
+    store_rendered_article(page, html_content, toc)
+
+
+def invalidate_rendered_article(page_id):
+    """
+    Drop the stored render for an article (unpublish, revert or deletion).
+    """
+    from knowledgebase.models import ArticleRenderedContent
+
+    cache.delete(render_cache_key(page_id))
+    ArticleRenderedContent.objects.filter(page_id=page_id).delete()
+
 
 def generate_article_html_and_toc(streamfield_data):
     """
     Generates the HTML content for the article, a table of contents (TOC),
     and adds internal links for citations.
     """
-    html_content = ""
     toc = []
-    current_h2 = None
-    current_h3 = None
-    heading_ids = set()
-    reference_map = {}  # Map reference numbers to their IDs
+    html_content = "".join(iter_article_html(streamfield_data, toc))
+    return html_content, toc
 
-    # First, process the references to create a map of reference numbers to IDs
-    for block_index, block in enumerate(streamfield_data):
-        if block.block_type == "references":
-            for ref_index, ref in enumerate(block.value):
-                ref_num = ref.get('reference_number')
-                ref_id = f"ref-{ref_num}"
-                reference_map[ref_num] = ref_id
 
-                # Assign the ID to the reference in the streamfield data for later use
-                block.value[ref_index]['id'] = ref_id
+def iter_article_html(streamfield_data, toc=None):
+    """
+    Yield the article HTML fragment by fragment, with citation links already
+    applied to each fragment. The TOC is filled in as headings are reached, so
+    pass a list to collect it. The generator can be handed straight to a
+    StreamingHttpResponse for very long articles.
+
+    Blocks that don't contribute to the TOC are served from the fragment cache
+    when their content and the set of references are unchanged, so editing one
+    paragraph only re-renders that paragraph.
+    """
+    if toc is None:
+        toc = []
+    reference_map = build_reference_map(streamfield_data)
+    toc_builder = TocBuilder(toc)
+
+    fragment_keys = {}
+    references_digest = hashlib.sha1(repr(sorted(reference_map, key=str)).encode()).hexdigest()
+    for index, block in enumerate(streamfield_data):
+        if block.block_type in CACHEABLE_BLOCK_TYPES and block.id is not None:
+            fragment_keys[index] = fragment_cache_key(block, references_digest)
+    cached_fragments = cache.get_many(fragment_keys.values()) if fragment_keys else {}
+    new_fragments = {}
+
+    for index, block in enumerate(streamfield_data):
+        render_block = BLOCK_RENDERERS.get(block.block_type)
+        if render_block is None:
+            continue
+
+        key = fragment_keys.get(index)
+        if key is None:
+            for fragment in render_block(block.value, toc_builder):
+                yield add_citation_links(fragment, reference_map)
+        elif key in cached_fragments:
+            yield cached_fragments[key]
+        else:
+            block_html = "".join(
+                add_citation_links(fragment, reference_map)
+                for fragment in render_block(block.value, toc_builder)
+            )
+            new_fragments[key] = block_html
+            yield block_html
+
+    if new_fragments:
+        cache.set_many(new_fragments, timeout=get_fragment_cache_timeout())
+
 
-    # Then, process all blocks to generate HTML content and TOC
+def fragment_cache_key(block, references_digest):
+    """
+    Key a block's rendered fragment by its type and id, a hash of its
+    content, the reference numbers its citations may link to and the renderer
+    version.
+    """
+    raw_value = block.block.get_api_representation(block.value)
+    content_hash = hashlib.sha1(
+        json.dumps(raw_value, sort_keys=True, cls=DjangoJSONEncoder).encode()
+    ).hexdigest()
+    return FRAGMENT_CACHE_KEY.format(
+        version=RENDERER_VERSION,
+        block_type=block.block_type,
+        block_id=block.id,
+        content_hash=content_hash,
+        references_digest=references_digest,
+    )
+
+
+def get_fragment_cache_timeout():
+    return getattr(settings, 'KB_FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
+
+
+def build_reference_map(streamfield_data):
+    """
+    Map reference numbers to the anchor IDs used in the reference list.
+    """
+    reference_map = {}
     for block in streamfield_data:
-        if block.block_type == "heading":
-            # Generate a unique ID for each heading based on its text content
-            heading_text = block.value['heading_text']
-            heading_id = slugify(heading_text)
-
-            # Ensure ID uniqueness
-            original_id = heading_id
-            counter = 1
-            while heading_id in heading_ids:
-                heading_id = f"{original_id}-{counter}"
-                counter += 1
-
-            heading_ids.add(heading_id)
-
-            # Append the heading to the TOC
-            level = int(block.value['level'][1])  # Extract h2, h3, h4...
-            if level == 2:
-                current_h2 = {'text': heading_text, 'id': heading_id, 'children': []}
-                toc.append(current_h2)
-                current_h3 = None
-            elif level == 3 and current_h2:
-                current_h3 = {'text': heading_text, 'id': heading_id, 'children': []}
-                current_h2['children'].append(current_h3)
-            elif level == 4 and current_h3:
-                current_h3['children'].append({'text': heading_text, 'id': heading_id})
-            elif level == 4 and current_h2:
-                current_h2['children'].append({'text': heading_text, 'id': heading_id})
-
-            # Add the heading to the HTML content with the generated ID
-            html_content += f"<h{level} id='{heading_id}'>{heading_text}</h{level}>"
-
-        elif block.block_type == "markdown":
-            # Directly use the value from MarkdownBlock
-            md = Markdown(extensions=['extra', 'codehilite'])
-            markdown_html = md.convert(str(block.value))
-            # markdown_html = add_citation_links(markdown_html, reference_map)
-            html_content += f"<div class='markdown-block'>{markdown_html}</div>"
-
-        elif block.block_type == "rich_text":
-            # Convert basic Markdown-like syntax to HTML (optional)
-            rich_text_html = str(block.value)
-            rich_text_html = rich_text_html.replace('\n', '<br>')  # Line breaks
-            rich_text_html = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', rich_text_html)  # Bold
-            rich_text_html = re.sub(r'\*(.+?)\*', r'<em>\1</em>', rich_text_html)  # Italics
-
-            # Add internal links for citations in rich text
-            # rich_text_html = add_citation_links(rich_text_html, reference_map)
-            html_content += f"<div class='rich-text'>{rich_text_html}</div>"
-
-        elif block.block_type == "bullet_points":
-            html_content += "<ul class='bullet-points'>"
-            for item in block.value:
-                html_content += f"<li>{item}</li>"
-            html_content += "</ul>"
-            # html_content = add_citation_links(html_content, reference_map)
-        elif block.block_type == "key_facts":
-            html_content += "<ul class='key-facts'>"
-            for fact in block.value['content']:
-                # Replace '\n' with '<br>' to create line breaks
-                formatted_fact = fact.replace('\n', '<br>')
-                html_content += f"<li>{formatted_fact}</li>"
-            html_content += "</ul>"
-        elif block.block_type == "faqs":
-            html_content += "<div class='faqs'>"
-            for faq in block.value:
-                html_content += f"<p><strong>{faq['question']}</strong></p><p>{faq['answer']}</p>"
-            html_content += "</div>"
-        elif block.block_type == "references":
-            html_content += "<div class='references'><ul>"
+        if block.block_type == "references":
             for ref in block.value:
-                ref_id = ref.get('id')  # Use the previously assigned ID
-                reference_number = ref.get('reference_number', '')
-                title = ref.get('title', '')
-                year = ref.get('year', '')
-                journal_source = ref.get('journal_source', '')
-                url = ref.get('url_doi', '').strip()
-
-                # Initialize variables for URL and link rendering
-                valid_url = ""
-                link_html = ""
-
-                if url:
-                    if url.startswith("http://") or url.startswith("https://"):
-                        valid_url = url
-                    elif url.startswith("www"):
-                        valid_url = f"https://{url}"
-                    elif url.startswith("10."):
-                        valid_url = f"https://doi.org/{url}"
-                    else:
-                        # Handle other cases or leave URL empty if invalid
-                        valid_url = None
-
-                # Conditionally render the <a> tag
-                if valid_url:
-                    link_html = f"<a href='{valid_url}' target='_blank'>{journal_source}</a>"
-                else:
-                    link_html = journal_source  # No link if URL is invalid or not provided
+                ref_num = ref.get('reference_number')
+                reference_map[ref_num] = f"ref-{ref_num}"
+    return reference_map
 
-                html_content += (
-                    f"<li id='{ref_id}' class='reference'>"
-                    f"<strong>{reference_number}</strong>. {title} ({year}) - {link_html}"
-                    f"</li>"
-                )
-            html_content += "</ul></div>"
 
-    html_content = add_citation_links(html_content, reference_map)
-    # html_content = html_content.encode('latin1').decode('unicode_escape')
+class TocBuilder:
+    """
+    Assigns unique heading IDs and nests h2/h3/h4 headings into the TOC.
+    """
+
+    def __init__(self, toc):
+        self.toc = toc
+        self.heading_ids = set()
+        self.current_h2 = None
+        self.current_h3 = None
+
+    def add_heading(self, heading_text, level):
+        # Generate a unique ID for each heading based on its text content
+        heading_id = slugify(heading_text)
+        original_id = heading_id
+        counter = 1
+        while heading_id in self.heading_ids:
+            heading_id = f"{original_id}-{counter}"
+            counter += 1
+        self.heading_ids.add(heading_id)
+
+        if level == 2:
+            self.current_h2 = {'text': heading_text, 'id': heading_id, 'children': []}
+            self.toc.append(self.current_h2)
+            self.current_h3 = None
+        elif level == 3 and self.current_h2:
+            self.current_h3 = {'text': heading_text, 'id': heading_id, 'children': []}
+            self.current_h2['children'].append(self.current_h3)
+        elif level == 4 and self.current_h3:
+            self.current_h3['children'].append({'text': heading_text, 'id': heading_id})
+        elif level == 4 and self.current_h2:
+            self.current_h2['children'].append({'text': heading_text, 'id': heading_id})
+
+        return heading_id
+
+
+def render_heading(value, toc_builder):
+    heading_text = value['heading_text']
+    level = int(value['level'][1])  # Extract h2, h3, h4...
+    heading_id = toc_builder.add_heading(heading_text, level)
+    yield f"<h{level} id='{heading_id}'>{heading_text}</h{level}>"
+
+
+def render_markdown(value, toc_builder):
+    yield f"<div class='markdown-block'>{convert_markdown(value)}</div>"
+
+
+def render_rich_text(value, toc_builder):
+    # Convert basic Markdown-like syntax to HTML
+    rich_text_html = str(value)
+    rich_text_html = rich_text_html.replace('\n', '<br>')  # Line breaks
+    rich_text_html = BOLD_PATTERN.sub(r'<strong>\1</strong>', rich_text_html)
+    rich_text_html = ITALIC_PATTERN.sub(r'<em>\1</em>', rich_text_html)
+    yield f"<div class='rich-text'>{rich_text_html}</div>"
+
+
+def render_bullet_points(value, toc_builder):
+    yield "<ul class='bullet-points'>"
+    for item in value:
+        yield f"<li>{item}</li>"
+    yield "</ul>"
+
+
+def render_key_facts(value, toc_builder):
+    yield "<ul class='key-facts'>"
+    for fact in value['content']:
+        # Replace '\n' with '<br>' to create line breaks
+        formatted_fact = fact.replace('\n', '<br>')
+        yield f"<li>{formatted_fact}</li>"
+    yield "</ul>"
+
+
+def render_faqs(value, toc_builder):
+    yield "<div class='faqs'>"
+    for faq in value:
+        yield f"<p><strong>{faq['question']}</strong></p><p>{faq['answer']}</p>"
+    yield "</div>"
+
+
+def render_references(value, toc_builder):
+    yield "<div class='references'><ul>"
+    for ref in value:
+        reference_number = ref.get('reference_number', '')
+        ref_id = f"ref-{ref.get('reference_number')}"
+        title = ref.get('title', '')
+        year = ref.get('year', '')
+        journal_source = ref.get('journal_source', '')
+        valid_url = normalize_reference_url(ref.get('url_doi', '').strip())
+
+        # Conditionally render the <a> tag
+        if valid_url:
+            link_html = f"<a href='{valid_url}' target='_blank'>{journal_source}</a>"
+        else:
+            link_html = journal_source  # No link if URL is invalid or not provided
+
+        yield (
+            f"<li id='{ref_id}' class='reference'>"
+            f"<strong>{reference_number}</strong>. {title} ({year}) - {link_html}"
+            f"</li>"
+        )
+    yield "</ul></div>"
+
+
+def normalize_reference_url(url):
+    """
+    Turn a reference's URL/DOI field into a linkable URL, or None if it can't be.
+    """
+    if not url:
+        return None
+    if url.startswith("http://") or url.startswith("https://"):
+        return url
+    if url.startswith("www"):
+        return f"https://{url}"
+    if url.startswith("10."):
+        return f"https://doi.org/{url}"
+    return None
 
-    return html_content, toc
 
+BLOCK_RENDERERS = {
+    "heading": render_heading,
+    "markdown": render_markdown,
+    "rich_text": render_rich_text,
+    "bullet_points": render_bullet_points,
+    "key_facts": render_key_facts,
+    "faqs": render_faqs,
+    "references": render_references,
+}
 
 def add_citation_links(text, reference_map):
     """
     Adds internal links to citations within a text block.
     """
-    # Regular expression to find citations like [1] or [1, 2]
-    citation_pattern = re.compile(r'\[([\d,\s]+)\]')
+    if '[' not in text:
+        return text
 
     def replace_citation(match):
         citation_numbers = match.group(1).split(',')
@@ -192,4 +436,4 @@ def add_citation_links(text, reference_map):
                 links.append(f"[{number}]")  # Invalid citation format
         return ", ".join(links)
 
-    return citation_pattern.sub(replace_citation, text)
\ No newline at end of file
+    return CITATION_PATTERN.sub(replace_citation, text)
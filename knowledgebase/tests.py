@@ -1,3 +1,778 @@
-from django.test import TestCase
+import gzip
+import json
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from markdown import Markdown
+from wagtail.images import get_image_model
+from wagtail.images.tests.utils import get_test_image_file
+from wagtail.models import PageViewRestriction, Site
+from wagtail.search.backends import get_search_backend
+
+from base import singleflight
+from base.models import FooterText
+from knowledgebase.models import IndexPage, CategoryPage, ArticlePage, ArticleRenderedContent, Reviewer
+from knowledgebase import import_pipeline, markdown_service, static_export, typeahead
+from knowledgebase.renditions import get_rendition_specs
+from knowledgebase.management.commands import import_articles_bulk
+from knowledgebase.templatetags import kb_tags
+
+# The manifest storage used in settings needs collectstatic, which tests don't run.
+TEST_STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+ARTICLE_BODY = [
+    {"id": "overview", "type": "heading", "value": {"heading_text": "Overview", "level": "h2"}},
+    {"id": "intro", "type": "markdown", "value": "Gout is a form of **arthritis** [1]."},
+    {"id": "causes", "type": "heading", "value": {"heading_text": "Causes", "level": "h3"}},
+    {"id": "causes-list", "type": "bullet_points", "value": ["High uric acid [1, 2]", "Diet"]},
+    {"id": "faqs", "type": "faqs", "value": [{"question": "Is it common?", "answer": "<p>Yes.</p>"}]},
+    {"id": "references", "type": "references", "value": [
+        {"reference_number": 1, "authors": "Smith", "year": "2020", "title": "Gout",
+         "journal_source": "BMJ", "url_doi": "10.1136/bmj.1"},
+        {"reference_number": 2, "authors": "Jones", "year": "2021", "title": "Uric acid",
+         "journal_source": "Lancet", "url_doi": ""},
+    ]},
+]
+
+# Output of the renderer for ARTICLE_BODY, kept byte-for-byte stable.
+ARTICLE_HTML = (
+    "<h2 id='overview'>Overview</h2>"
+    "<div class='markdown-block'><p>Gout is a form of <strong>arthritis</strong> <a href='#ref-1'>[1]</a>.</p></div>"
+    "<h3 id='causes'>Causes</h3>"
+    "<ul class='bullet-points'><li>High uric acid <a href='#ref-1'>[1]</a>, <a href='#ref-2'>[2]</a></li><li>Diet</li></ul>"
+    "<div class='faqs'><p><strong>Is it common?</strong></p><p><p>Yes.</p></p></div>"
+    "<div class='references'><ul>"
+    "<li id='ref-1' class='reference'><strong>1</strong>. Gout (2020) - <a href='https://doi.org/10.1136/bmj.1' target='_blank'>BMJ</a></li>"
+    "<li id='ref-2' class='reference'><strong>2</strong>. Uric acid (2021) - Lancet</li>"
+    "</ul></div>"
+)
+
+
+def article_body(raw_body=ARTICLE_BODY):
+    return ArticlePage._meta.get_field("body").stream_block.to_python(raw_body)
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class KnowledgebaseTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        root_page = Site.objects.get(is_default_site=True).root_page
+
+        self.index_page = IndexPage(title="Index", slug="index")
+        root_page.add_child(instance=self.index_page)
+        self.index_page.save_revision().publish()
+
+        self.category_page = self.create_category("Joints")
+        self.article = self.create_article(self.category_page, "Gout")
+
+    def create_category(self, title):
+        category_page = CategoryPage(title=title)
+        self.index_page.add_child(instance=category_page)
+        category_page.save_revision().publish()
+        return category_page
+
+    def create_article(self, category_page, title, **kwargs):
+        article = ArticlePage(title=title, body=ARTICLE_BODY, category=category_page, **kwargs)
+        category_page.add_child(instance=article)
+        article.save_revision().publish()
+        article.refresh_from_db()
+        return article
+
+
+class ArticlePageRenderTests(KnowledgebaseTestCase):
+    def test_article_is_rendered_once_per_view(self):
+        cache.clear()
+        ArticleRenderedContent.objects.all().delete()
+        with mock.patch.object(
+            kb_tags, "generate_article_html_and_toc", wraps=kb_tags.generate_article_html_and_toc
+        ) as renderer, mock.patch.object(
+            kb_tags, "get_rendered_article", wraps=kb_tags.get_rendered_article
+        ) as lookup:
+            response = self.client.get(self.article.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(renderer.call_count, 1)
+        self.assertEqual(lookup.call_count, 1)
+        self.assertContains(response, "<a href='#ref-1'>[1]</a>")
+        self.assertContains(response, 'href="#overview"')
+
+    def test_publish_stores_rendered_content(self):
+        rendered = ArticleRenderedContent.objects.get(page=self.article)
+        self.assertEqual(rendered.revision_id, self.article.live_revision_id)
+        self.assertEqual(rendered.toc[0]["id"], "overview")
+        self.assertIn("Gout is a form of arthritis", rendered.plain_text)
+        self.assertEqual(rendered.word_count, len(rendered.plain_text.split()))
+
+        cache.clear()
+        with mock.patch.object(kb_tags, "generate_article_html_and_toc") as renderer:
+            response = self.client.get(self.article.url)
+        self.assertEqual(response.status_code, 200)
+        renderer.assert_not_called()
+
+    def test_saving_a_draft_keeps_the_live_render(self):
+        live_revision_id = self.article.live_revision_id
+        self.article.title = "Gout (draft)"
+        self.article.save_revision()
+
+        with mock.patch.object(kb_tags, "generate_article_html_and_toc") as renderer:
+            response = self.client.get(self.article.url)
+        self.assertEqual(response.status_code, 200)
+        renderer.assert_not_called()
+        self.assertEqual(ArticleRenderedContent.objects.get(page=self.article).revision_id, live_revision_id)
+
+    def test_render_waits_for_one_in_flight_elsewhere(self):
+        cache.clear()
+        ArticleRenderedContent.objects.all().delete()
+        rendered = kb_tags.generate_article_html_and_toc(self.article.body)
+        # Another worker is rendering this revision and caches it shortly.
+        cache.add(singleflight.lock_key(kb_tags.RENDER_FLIGHT_KEY.format(
+            page_id=self.article.pk, revision_id=self.article.live_revision_id,
+        )), "other", timeout=30)
+        threading.Timer(0.1, kb_tags.cache_rendered_article, (self.article, *rendered)).start()
+
+        with mock.patch.object(kb_tags, "generate_article_html_and_toc") as renderer:
+            self.assertEqual(kb_tags.get_rendered_article(self.article), rendered)
+        renderer.assert_not_called()
+
+    def test_unpublish_removes_rendered_content(self):
+        self.article.unpublish()
+        self.assertFalse(ArticleRenderedContent.objects.filter(page=self.article).exists())
+
+
+class ConditionalGetTests(KnowledgebaseTestCase):
+    def test_article_answers_if_none_match_without_rendering(self):
+        response = self.client.get(self.article.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Last-Modified", response.headers)
+
+        with mock.patch.object(ArticlePage, "get_context") as get_context:
+            response = self.client.get(self.article.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        get_context.assert_not_called()
+
+    def test_article_answers_if_modified_since(self):
+        response = self.client.get(self.article.url)
+        response = self.client.get(self.article.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_article_validators_follow_its_reviewer(self):
+        reviewer = Reviewer.objects.create(name="Dr. Lee")
+        self.article.reviewer = reviewer
+        self.article.save_revision().publish()
+        first = self.client.get(self.article.url)
+
+        reviewer.name = "Dr. Lee-Smith"
+        reviewer.save()
+        # Last-Modified has one-second resolution; edit "a minute later".
+        Reviewer.objects.filter(pk=reviewer.pk).update(updated_at=timezone.now() + timedelta(minutes=1))
+        response = self.client.get(self.article.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertContains(response, "Dr. Lee-Smith")
+        response = self.client.get(self.article.url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_follows_the_footer(self):
+        etag = self.client.get(self.article.url)["ETag"]
+        FooterText.objects.create(body="<p>New footer</p>", live=True)
+        self.assertEqual(self.client.get(self.article.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_category_etag_follows_its_articles(self):
+        etag = self.client.get(self.category_page.url)["ETag"]
+        self.assertEqual(self.client.get(self.category_page.url)["ETag"], etag)
+
+        self.create_article(self.category_page, "Bursitis")
+        response = self.client.get(self.category_page.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_index_etag_follows_its_categories(self):
+        etag = self.client.get(self.index_page.url)["ETag"]
+        self.create_category("Skin")
+        self.assertNotEqual(self.client.get(self.index_page.url)["ETag"], etag)
+
+
+class CategoryListingTests(KnowledgebaseTestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        super().setUp()
+
+    def add_articles(self, count):
+        for number in range(count):
+            image = get_image_model().objects.create(
+                title=f"Image {number}", file=get_test_image_file(f"card-{number}.png")
+            )
+            self.create_article(
+                self.category_page, f"Article {number}", intro="An introduction.", article_image=image
+            )
+
+    def count_listing_queries(self):
+        # Warm up once so rendition generation isn't counted, then bypass the
+        # page cache for the measured request.
+        self.client.get(self.category_page.url)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.category_page.url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_listing_uses_a_constant_number_of_queries(self):
+        self.add_articles(2)
+        few = self.count_listing_queries()
+        self.add_articles(8)
+        self.assertEqual(self.count_listing_queries(), few)
+
+    def test_listing_shows_cards(self):
+        self.add_articles(1)
+        response = self.client.get(self.category_page.url)
+        self.assertContains(response, "An introduction.")
+        self.assertContains(response, '<source srcset="')
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, 'loading="lazy"')
+        for width in (320, 480, 800):
+            self.assertContains(response, f"fill-{width}x{width * 3 // 4}.format-jpeg")
+
+    def test_card_renditions_are_fetched_together(self):
+        self.add_articles(1)
+        article = ArticlePage.objects.get(title="Article 0")
+        article.get_image_picture()  # create the renditions
+        image = get_image_model().objects.get(pk=article.article_image_id)
+        article.article_image = image
+        cache.clear()  # wagtail also caches renditions
+
+        with self.assertNumQueries(1):
+            picture = article.get_image_picture()
+        self.assertEqual(len(picture.renditions), 6)
+        self.assertEqual(set(picture.formats), {"webp", "jpeg"})
+
+    def test_json_cards_carry_the_srcset(self):
+        self.add_articles(1)
+        response = self.client.get(reverse("category_articles", args=[self.category_page.pk]))
+        image = response.json()["articles"][0]["image"]
+        self.assertEqual((image["width"], image["height"]), (320, 240))
+        self.assertEqual([source["type"] for source in image["sources"]], ["image/webp", "image/jpeg"])
+        self.assertIn("fill-800x600.format-webp", image["sources"][0]["srcset"])
+
+
+@override_settings(KB_CATEGORY_PAGE_SIZE=2)
+class CategoryPaginationTests(KnowledgebaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for title in ["Arthritis", "Bursitis", "Bursitis", "Tendinitis"]:
+            self.create_article(self.category_page, title)
+        self.json_url = reverse("category_articles", args=[self.category_page.pk])
+
+    def test_json_endpoint_walks_every_article_once(self):
+        titles, ids, cursor = [], [], None
+        while True:
+            response = self.client.get(self.json_url, {"after": cursor} if cursor else {})
+            data = response.json()
+            titles += [card["title"] for card in data["articles"]]
+            ids += [card["id"] for card in data["articles"]]
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+
+        self.assertEqual(titles, ["Arthritis", "Bursitis", "Bursitis", "Gout", "Tendinitis"])
+        self.assertEqual(len(set(ids)), 5)
+
+    def test_category_page_links_to_the_next_page(self):
+        response = self.client.get(self.category_page.url)
+        self.assertEqual([article.title for article in response.context["articles"]], ["Arthritis", "Bursitis"])
+
+        response = self.client.get(self.category_page.url, {"after": response.context["next_cursor"]})
+        self.assertEqual([article.title for article in response.context["articles"]], ["Bursitis", "Gout"])
+
+    def test_invalid_cursor_starts_from_the_beginning(self):
+        response = self.client.get(self.json_url, {"after": "not-a-cursor"})
+        self.assertEqual(response.json()["articles"][0]["title"], "Arthritis")
+
+    def test_unknown_category_is_404(self):
+        response = self.client.get(reverse("category_articles", args=[self.article.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_restricted_category_is_404_until_unlocked(self):
+        restriction = PageViewRestriction.objects.create(
+            page=self.category_page, restriction_type="password", password="secret"
+        )
+        self.assertEqual(self.client.get(self.json_url).status_code, 404)
+
+        unlock_url = reverse("wagtailcore_authenticate_with_password", args=[restriction.pk, self.category_page.pk])
+        self.client.post(unlock_url, {"password": "secret", "return_url": self.category_page.url})
+        self.assertEqual(self.client.get(self.json_url).status_code, 200)
+
+    def test_restricted_articles_are_not_listed(self):
+        PageViewRestriction.objects.create(page=self.article, restriction_type="login")
+        titles, cursor = [], None
+        while True:
+            data = self.client.get(self.json_url, {"after": cursor} if cursor else {}).json()
+            titles += [card["title"] for card in data["articles"]]
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(titles, ["Arthritis", "Bursitis", "Bursitis", "Tendinitis"])
+
+        response = self.client.get(self.category_page.url)
+        response = self.client.get(self.category_page.url, {"after": response.context["next_cursor"]})
+        self.assertEqual([article.title for article in response.context["articles"]], ["Bursitis", "Tendinitis"])
+
+
+class IndexListingTests(KnowledgebaseTestCase):
+    def test_categories_are_annotated_with_article_counts(self):
+        self.create_article(self.category_page, "Bursitis")
+        self.create_category("Skin")
+        Site.get_site_root_paths()  # Wagtail caches these for URL building.
+
+        with self.assertNumQueries(1):
+            summaries = self.index_page.get_category_summaries()
+        with self.assertNumQueries(0):
+            self.index_page.get_category_summaries()
+
+        self.assertEqual([(s["title"], s["article_count"]) for s in summaries], [("Joints", 2), ("Skin", 0)])
+        self.assertIsNotNone(summaries[0]["last_updated"])
+        self.assertIsNone(summaries[1]["last_updated"])
+
+    def test_summaries_are_invalidated_on_publish_and_unpublish(self):
+        self.index_page.get_category_summaries()
+        article = self.create_article(self.category_page, "Bursitis")
+        self.assertEqual(self.index_page.get_category_summaries()[0]["article_count"], 2)
+
+        article.unpublish()
+        self.assertEqual(self.index_page.get_category_summaries()[0]["article_count"], 1)
+
+    def test_index_page_shows_counts(self):
+        response = self.client.get(self.index_page.url)
+        self.assertContains(response, "1 article")
+
+
+@override_settings(KB_RENDITIONS_ASYNC=False)
+class RenditionPregenerationTests(KnowledgebaseTestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        super().setUp()
+
+    def create_image(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            return get_image_model().objects.create(title="Photo", file=get_test_image_file())
+
+    def rendition_specs(self, image):
+        return set(image.renditions.values_list("filter_spec", flat=True))
+
+    def test_upload_generates_every_configured_rendition(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = get_image_model().objects.create(title="Photo", file=get_test_image_file())
+        self.assertEqual(self.rendition_specs(image), set(get_rendition_specs()))
+
+    def test_assigning_images_generates_their_renditions(self):
+        image = self.create_image()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_article(self.category_page, "Bursitis", article_image=image)
+        self.assertEqual(self.rendition_specs(image), set(get_rendition_specs("article_image")))
+
+        photo = self.create_image()
+        with self.captureOnCommitCallbacks(execute=True):
+            Reviewer.objects.create(name="Dr. Lee", photo=photo)
+        self.assertEqual(self.rendition_specs(photo), set(get_rendition_specs("reviewer_photo")))
+
+    def test_command_covers_the_whole_library(self):
+        images = [self.create_image() for _ in range(3)]
+        call_command("generate_renditions", workers=1, stdout=StringIO())
+        for image in images:
+            self.assertEqual(self.rendition_specs(image), set(get_rendition_specs()))
+
+
+class StaticExportTests(KnowledgebaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.export_root = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.export_root, ignore_errors=True)
+
+    def test_export_site_writes_every_live_page(self):
+        exported = static_export.export_site(self.export_root)
+
+        self.assertEqual(exported, 4)  # home, index, category, article
+        article_html = self.export_root / "index" / self.category_page.slug / self.article.slug / "index.html"
+        self.assertIn(b"Gout is a form of", article_html.read_bytes())
+        self.assertTrue(Path(f"{article_html}.gz").exists())
+        self.assertTrue((self.export_root / "index.html").exists())
+
+    def test_publish_reexports_article_category_and_index(self):
+        with override_settings(STATIC_EXPORT_ROOT=str(self.export_root)):
+            article = self.create_article(self.category_page, "Bursitis")
+
+        category_dir = self.export_root / "index" / self.category_page.slug
+        self.assertTrue((category_dir / article.slug / "index.html").exists())
+        self.assertIn(b"Bursitis", (category_dir / "index.html").read_bytes())
+        self.assertTrue((self.export_root / "index" / "index.html").exists())
+        self.assertFalse((category_dir / self.article.slug / "index.html").exists())
+
+        with override_settings(STATIC_EXPORT_ROOT=str(self.export_root)):
+            article.unpublish()
+        self.assertFalse((category_dir / article.slug / "index.html").exists())
+
+
+    @override_settings(KB_CATEGORY_PAGE_SIZE=2)
+    def test_exported_category_lists_every_article(self):
+        for title in ("Bursitis", "Sprain", "Tendinitis"):
+            self.create_article(self.category_page, title)
+        static_export.export_site(self.export_root)
+
+        category_html = (self.export_root / "index" / self.category_page.slug / "index.html").read_text()
+        for title in ("Bursitis", "Gout", "Sprain", "Tendinitis"):
+            self.assertIn(title, category_html)
+        self.assertNotIn("load-more-articles", category_html)
+        self.assertContains(self.client.get(self.category_page.url), "load-more-articles")
+
+    def test_view_restricted_pages_are_not_exported(self):
+        article_html = self.export_root / "index" / self.category_page.slug / self.article.slug / "index.html"
+        with override_settings(STATIC_EXPORT_ROOT=str(self.export_root)):
+            static_export.export_site(self.export_root)
+            self.assertTrue(article_html.exists())
+
+            restriction = PageViewRestriction.objects.create(
+                page=self.category_page, restriction_type="password", password="secret"
+            )
+            self.assertFalse(article_html.exists())
+            self.assertFalse(Path(f"{article_html}.gz").exists())
+
+            static_export.export_site(self.export_root)
+            self.assertFalse(article_html.exists())
+            self.assertIsNone(static_export.export_page(self.article, self.export_root))
+
+            restriction.delete()
+            self.assertTrue(article_html.exists())
+
+    def test_renamed_moved_and_deleted_pages_leave_no_files_behind(self):
+        index_dir = self.export_root / "index"
+        with override_settings(STATIC_EXPORT_ROOT=str(self.export_root)):
+            article = self.create_article(self.category_page, "Bursitis")
+            self.assertTrue((index_dir / "joints" / "bursitis" / "index.html").exists())
+
+            article.slug = "bursitis-of-the-knee"
+            article.save_revision().publish()
+            self.assertFalse((index_dir / "joints" / "bursitis" / "index.html").exists())
+            self.assertFalse(Path(index_dir / "joints" / "bursitis" / "index.html.gz").exists())
+            self.assertTrue((index_dir / "joints" / "bursitis-of-the-knee" / "index.html").exists())
+
+            self.category_page.slug = "joint-health"
+            self.category_page.save_revision().publish()
+            self.assertFalse((index_dir / "joints" / "index.html").exists())
+            self.assertFalse((index_dir / "joints" / "gout" / "index.html").exists())
+            self.assertTrue((index_dir / "joint-health" / "gout" / "index.html").exists())
+
+            skin = self.create_category("Skin")
+            article.refresh_from_db()
+            article.move(skin, pos="last-child")
+            self.assertFalse((index_dir / "joint-health" / "bursitis-of-the-knee" / "index.html").exists())
+            self.assertTrue((index_dir / "skin" / "bursitis-of-the-knee" / "index.html").exists())
+            self.assertIn(b"Bursitis", (index_dir / "skin" / "index.html").read_bytes())
+            self.assertNotIn(b"Bursitis", (index_dir / "joint-health" / "index.html").read_bytes())
+
+            article.delete()
+            self.assertFalse((index_dir / "skin" / "bursitis-of-the-knee" / "index.html").exists())
+            self.assertNotIn(b"Bursitis", (index_dir / "skin" / "index.html").read_bytes())
+
+
+class BulkImportTests(KnowledgebaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.source, ignore_errors=True)
+
+    def write_article(self, relative_path, title, overview="Overview text."):
+        path = self.source / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({
+            "title": title,
+            "subtitle": f"About {title.lower()}.",
+            "keywords": ["pain", "swelling"],
+            "overview": {"heading": "Overview", "content": overview},
+        }))
+        return path
+
+    def import_bulk(self, source, **options):
+        stdout = StringIO()
+        call_command("import_articles_bulk", str(source), stdout=stdout, stderr=StringIO(), **options)
+        return stdout.getvalue()
+
+    def test_directory_imports_one_category_per_subdirectory(self):
+        self.write_article("Joints/bursitis.json", "Bursitis")
+        self.write_article("Joints/gout.json", "Gout")
+        self.write_article("Sleep Health/insomnia.json", "Insomnia")
+
+        with mock.patch("knowledgebase.management.commands.import_articles_bulk.FixTreeCommand") as fixtree:
+            output = self.import_bulk(self.source, batch_size=2)
+
+        fixtree.return_value.handle.assert_called_once()
+        self.assertIn("Created 2, updated 1, unchanged 0, failed 0", output)
+        joints_titles = set(self.category_page.get_children().values_list("title", flat=True))
+        self.assertEqual(joints_titles, {"Gout", "Bursitis"})
+        insomnia = ArticlePage.objects.get(title="Insomnia")
+        self.assertEqual(insomnia.get_parent().title, "Sleep Health")
+        self.assertEqual(insomnia.keywords, "pain, swelling")
+        self.assertTrue(insomnia.live)
+
+    def test_manifests_map_files_to_categories(self):
+        self.write_article("files/bursitis.json", "Bursitis")
+        self.write_article("files/insomnia.json", "Insomnia")
+        csv_manifest = self.source / "manifest.csv"
+        csv_manifest.write_text("path,category\nfiles/bursitis.json,Joints\nfiles/missing.json,Joints\n")
+        json_manifest = self.source / "manifest.json"
+        json_manifest.write_text(json.dumps({"Sleep": ["files/insomnia.json"]}))
+
+        self.assertIn("Created 1, updated 0, unchanged 0, failed 1", self.import_bulk(csv_manifest, skip_tree_check=True))
+        self.assertIn("Created 1, updated 0, unchanged 0, failed 0", self.import_bulk(json_manifest, skip_tree_check=True))
+        self.assertEqual(ArticlePage.objects.get(title="Bursitis").get_parent().pk, self.category_page.pk)
+        self.assertEqual(ArticlePage.objects.get(title="Insomnia").get_parent().title, "Sleep")
+
+
+    def test_workers_parse_in_parallel_and_write_in_order(self):
+        for number in range(6):
+            self.write_article(f"Joints/note-{number}.json", f"Note {number}", overview=f"Note **{number}**.")
+        (self.source / "Joints" / "note-6.json").write_text("{not json")
+
+        with mock.patch("knowledgebase.management.commands.import_articles_bulk.FixTreeCommand"):
+            output = self.import_bulk(self.source, workers=2, max_pending=2, batch_size=4)
+
+        self.assertIn("Created 6, updated 0, unchanged 0, failed 1", output)
+        self.assertIn("Parse: 7 in", output)
+        titles = list(self.category_page.get_children().order_by("path").values_list("title", flat=True))
+        self.assertEqual(titles, ["Gout"] + [f"Note {number}" for number in range(6)])
+        note = ArticlePage.objects.get(title="Note 3")
+        self.assertIn("<strong>3</strong>", kb_tags.get_rendered_article(note)[0])
+
+    def test_unchanged_articles_are_skipped_on_reimport(self):
+        self.write_article("Joints/bursitis.json", "Bursitis")
+        self.write_article("Joints/tendinitis.json", "Tendinitis")
+        self.import_bulk(self.source, skip_tree_check=True)
+        bursitis = ArticlePage.objects.get(title="Bursitis")
+        revision_id = bursitis.latest_revision_id
+        self.assertEqual(len(bursitis.source_hash), 64)
+
+        self.write_article("Joints/tendinitis.json", "Tendinitis", overview="Revised overview.")
+        with mock.patch("knowledgebase.signals.warm_rendered_article") as warm:
+            output = self.import_bulk(self.source, skip_tree_check=True)
+        self.assertIn("Created 0, updated 1, unchanged 1, failed 0", output)
+        self.assertEqual(ArticlePage.objects.get(title="Bursitis").latest_revision_id, revision_id)
+        warm.assert_called_once()  # only the changed article was published
+
+        output = self.import_bulk(self.source, skip_tree_check=True, force=True)
+        self.assertIn("Created 0, updated 2, unchanged 0, failed 0", output)
+
+    def write_bundle(self, name, titles):
+        lines = [
+            json.dumps({"category": "Joints", "title": title, "overview": {"heading": "Overview", "content": "Text."}})
+            for title in titles
+        ]
+        path = self.source / name
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(path, "wt") as f:
+            f.write("\n".join(lines[:2] + ["", "{broken"] + lines[2:]) + "\n")
+        return path
+
+    def test_gzipped_bundle_is_streamed(self):
+        bundle = self.write_bundle("articles.jsonl.gz", ["Bursitis", "Tendinitis", "Sprain"])
+        stderr = StringIO()
+        call_command("import_articles_bulk", str(bundle), skip_tree_check=True, stdout=StringIO(), stderr=stderr)
+        self.assertIn("articles.jsonl.gz:4", stderr.getvalue())
+        titles = set(ArticlePage.objects.child_of(self.category_page).values_list("title", flat=True))
+        self.assertEqual(titles, {"Gout", "Bursitis", "Tendinitis", "Sprain"})
+
+    def test_failed_bundle_import_resumes_from_the_checkpoint(self):
+        bundle = self.write_bundle("articles.ndjson", ["Bursitis", "Tendinitis", "Sprain", "Strain"])
+        checkpoint = self.source / "import.checkpoint"
+        import_prepared = import_articles_bulk.Command.import_prepared
+
+        def fail_on_sprain(command, prepared, *args):
+            if prepared.article_data and prepared.article_data["title"] == "Sprain":
+                raise RuntimeError("database went away")
+            return import_prepared(command, prepared, *args)
+
+        with mock.patch.object(import_articles_bulk.Command, "import_prepared", autospec=True, side_effect=fail_on_sprain):
+            with self.assertRaises(RuntimeError):
+                self.import_bulk(bundle, batch_size=2, checkpoint=str(checkpoint), skip_tree_check=True)
+        self.assertEqual(json.loads(checkpoint.read_text())["line"], 2)
+        self.assertFalse(ArticlePage.objects.filter(title="Sprain").exists())
+
+        output = self.import_bulk(bundle, batch_size=2, checkpoint=str(checkpoint), resume=True, skip_tree_check=True)
+        self.assertIn("Created 2, updated 0, unchanged 0, failed 1", output)
+        titles = set(ArticlePage.objects.child_of(self.category_page).values_list("title", flat=True))
+        self.assertEqual(titles, {"Gout", "Bursitis", "Tendinitis", "Sprain", "Strain"})
+        self.assertEqual(json.loads(checkpoint.read_text())["line"], 6)
+
+    def test_deferred_signals_index_each_batch_in_bulk(self):
+        for title in ("Bursitis", "Tendinitis", "Sprain"):
+            self.write_article(f"Joints/{title.lower()}.json", title, overview="Inflamed tissue.")
+        backend = get_search_backend()
+
+        with mock.patch.object(type(backend), "add_bulk", autospec=True, side_effect=type(backend).add_bulk) as add_bulk:
+            self.import_bulk(self.source, batch_size=2, defer_signals=True, skip_tree_check=True)
+
+        article_batches = [objects for _, model, objects in (call.args for call in add_bulk.call_args_list)
+                           if model is ArticlePage]
+        self.assertEqual([len(objects) for objects in article_batches], [2, 1])
+        results = {page.title for page in ArticlePage.objects.live().search("inflamed")}
+        self.assertEqual(results, {"Bursitis", "Tendinitis", "Sprain"})
+
+    def test_pipeline_parses_lazily_in_order(self):
+        entries = [(self.write_article(f"Joints/note-{number}.json", f"Note {number}"), "Joints") for number in range(5)]
+        with mock.patch.object(import_pipeline, "prepare_article", wraps=import_pipeline.prepare_article) as prepare:
+            prepared = import_pipeline.iter_prepared_articles(entries)
+            next(prepared)
+            self.assertEqual(prepare.call_count, 1)
+            self.assertEqual([item.article_data["title"] for item in prepared], [f"Note {n}" for n in range(1, 5)])
+
+
+class TypeaheadTests(KnowledgebaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_article(self.category_page, "Gouty arthritis", keywords="uric acid, joint pain")
+        self.url = reverse("search_typeahead")
+
+    def suggest(self, query):
+        return self.client.get(self.url, {"q": query}).json()["results"]
+
+    def test_prefix_matches_rank_articles_categories_then_keywords(self):
+        self.assertEqual([result["label"] for result in self.suggest("GOU")], ["Gout", "Gouty arthritis"])
+        self.assertEqual([result["label"] for result in self.suggest("joi")], ["Joints", "joint pain"])
+        self.assertEqual(self.suggest("acid")[0], {
+            "label": "uric acid", "url": "/index/joints/gouty-arthritis/", "kind": "keyword", "title": "Gouty arthritis",
+        })
+        self.assertEqual(self.suggest("  "), [])
+
+    def test_lookups_are_served_from_the_worker_index(self):
+        self.suggest("gout")
+        with self.assertNumQueries(0):
+            self.suggest("art")
+
+    def test_publish_and_unpublish_update_every_worker(self):
+        self.suggest("gout")
+        article = self.create_article(self.category_page, "Bunions")
+        self.assertEqual(self.suggest("bun")[0]["label"], "Bunions")
+
+        article.unpublish()
+        self.assertEqual(self.suggest("bun"), [])
+
+    def test_restricted_pages_are_not_suggested(self):
+        self.suggest("gout")
+        restriction = PageViewRestriction.objects.create(
+            page=self.category_page, restriction_type="password", password="secret"
+        )
+        self.assertEqual(self.suggest("gou"), [])
+        self.assertEqual(self.suggest("joi"), [])
+
+        restriction.delete()
+        self.assertEqual([result["label"] for result in self.suggest("GOU")], ["Gout", "Gouty arthritis"])
+
+    def test_updates_only_write_their_own_page(self):
+        self.suggest("gout")
+        gout_key = typeahead.page_entries_key(self.article.pk)
+        cache.set(gout_key, [["Gout (cached)", self.article.url, "article", 3.0, "Gout"]], timeout=None)
+        self.create_article(self.category_page, "Bunions")
+
+        self.assertEqual(self.suggest("gout")[0]["label"], "Gout (cached)")
+        self.assertEqual(self.suggest("bun")[0]["label"], "Bunions")
+
+    def test_missing_entries_are_rebuilt(self):
+        self.suggest("gout")
+        cache.delete(typeahead.page_entries_key(self.article.pk))
+        typeahead.bump_generation()
+        self.assertEqual(self.suggest("gout")[0]["label"], "Gout")
+
+        typeahead.rebuild()
+        self.assertEqual([result["label"] for result in self.suggest("GOU")], ["Gout", "Gouty arthritis"])
+
+
+class ArticleRendererTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_output_is_stable(self):
+        html_content, toc = kb_tags.generate_article_html_and_toc(article_body())
+        self.assertEqual(html_content, ARTICLE_HTML)
+        self.assertEqual(toc, [
+            {"text": "Overview", "id": "overview", "children": [
+                {"text": "Causes", "id": "causes", "children": []},
+            ]},
+        ])
+
+    def test_fragments_can_be_streamed(self):
+        toc = []
+        response = StreamingHttpResponse(kb_tags.iter_article_html(article_body(), toc))
+        self.assertEqual(b"".join(response.streaming_content).decode(), ARTICLE_HTML)
+        self.assertEqual(toc[0]["id"], "overview")
+
+    def test_only_changed_blocks_are_rerendered(self):
+        kb_tags.generate_article_html_and_toc(article_body())
+
+        edited_body = [dict(block) for block in ARTICLE_BODY]
+        edited_body[1] = {"id": "intro", "type": "markdown", "value": "Gout is a **painful** arthritis [2]."}
+        renderers = {
+            block_type: mock.Mock(wraps=renderer)
+            for block_type, renderer in kb_tags.BLOCK_RENDERERS.items()
+        }
+        with mock.patch.dict(kb_tags.BLOCK_RENDERERS, renderers):
+            html_content, toc = kb_tags.generate_article_html_and_toc(article_body(edited_body))
+
+        self.assertEqual(renderers["markdown"].call_count, 1)
+        self.assertEqual(renderers["references"].call_count, 0)
+        self.assertEqual(renderers["bullet_points"].call_count, 0)
+        self.assertIn("<strong>painful</strong> arthritis <a href='#ref-2'>[2]</a>", html_content)
+        self.assertEqual(toc[0]["children"][0]["id"], "causes")
+
+    def test_blocks_of_different_types_never_share_a_fragment(self):
+        body = [{"type": "bullet_points", "value": []}, {"type": "references", "value": []}]
+        first = kb_tags.generate_article_html_and_toc(article_body(body))[0]
+        self.assertEqual(kb_tags.generate_article_html_and_toc(article_body(body))[0], first)
+
+        body = [{"id": "a", "type": "bullet_points", "value": []}, {"id": "a", "type": "references", "value": []}]
+        kb_tags.generate_article_html_and_toc(article_body(body))
+        self.assertEqual(kb_tags.generate_article_html_and_toc(article_body(body))[0], first)
+
+    def test_new_reference_rerenders_citing_blocks(self):
+        kb_tags.generate_article_html_and_toc(article_body())
+
+        edited_body = [dict(block) for block in ARTICLE_BODY]
+        edited_body[-1] = {"id": "references", "type": "references", "value": ARTICLE_BODY[-1]["value"][:1]}
+        html_content, toc = kb_tags.generate_article_html_and_toc(article_body(edited_body))
+
+        self.assertIn("<li>High uric acid <a href='#ref-1'>[1]</a>, [2]</li>", html_content)
+
+
+class MarkdownServiceTests(SimpleTestCase):
+    def setUp(self):
+        markdown_service.clear_markdown_cache()
+
+    def test_output_matches_a_fresh_engine(self):
+        text = "Text with a note[^1]\n\n[^1]: The note.\n\n```python\nx = 1\n```"
+        expected = Markdown(extensions=list(markdown_service.DEFAULT_EXTENSIONS)).convert(text)
+        self.assertEqual(markdown_service.convert_markdown(text), expected)
+        self.assertEqual(markdown_service.convert_markdown(text), expected)
+        self.assertEqual(markdown_service.markdown_cache_info()["hits"], 1)
+
+    @override_settings(KB_MARKDOWN_CACHE_SIZE=2)
+    def test_cache_is_bounded(self):
+        for text in ["a", "b", "c"]:
+            markdown_service.convert_markdown(text)
+        markdown_service.convert_markdown("a")
+        info = markdown_service.markdown_cache_info()
+        self.assertEqual(info["size"], 2)
+        self.assertEqual(info["misses"], 4)
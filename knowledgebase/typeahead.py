@@ -0,0 +1,235 @@
+# knowledgebase/typeahead.py
+import bisect
+import math
+import threading
+import unicodedata
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from wagtail.models import Page
+
+# Each page's entries are stored under their own key, so updating one page
+# never rewrites (and can't lose) another's. rebuild() retires them all by
+# moving to a new version.
+PAGE_ENTRIES_CACHE_KEY = "kb:typeahead:page:{version}:{page_id}"
+VERSION_CACHE_KEY = "kb:typeahead:version"
+GENERATION_CACHE_KEY = "kb:typeahead:generation"
+
+# Article titles outrank categories, which outrank keyword matches. Categories
+# with more articles rank a little higher among themselves.
+ARTICLE_SCORE = 3.0
+CATEGORY_SCORE = 2.0
+KEYWORD_SCORE = 1.0
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_limit():
+    return getattr(settings, 'KB_TYPEAHEAD_LIMIT', 8)
+
+
+def normalize(text):
+    """
+    Lowercase, strip accents and collapse whitespace, so "Gout ", "GOUT" and
+    "goût" all match the same entries.
+    """
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.split())
+
+
+def build_page_entries(page, article_count=0):
+    """
+    Return the typeahead entries of a live article or category page as
+    [label, url, kind, score, page title] lists.
+    """
+    from .models import ArticlePage, CategoryPage
+
+    url = page.get_url()
+    if url is None:
+        return []
+    if isinstance(page, ArticlePage):
+        keywords = {keyword.strip() for keyword in page.keywords.split(',') if keyword.strip()}
+        return [[page.title, url, 'article', ARTICLE_SCORE, page.title]] + [
+            [keyword, url, 'keyword', KEYWORD_SCORE, page.title] for keyword in sorted(keywords)
+        ]
+    if isinstance(page, CategoryPage):
+        return [[page.title, url, 'category', CATEGORY_SCORE + math.log1p(article_count) / 10, page.title]]
+    return []
+
+
+def build_entries(page_ids=None):
+    """
+    Entries for the given live, public articles and categories (default: all
+    of them), keyed by page id. Categories are ranked by their live article
+    counts, taken from one query over article paths.
+    """
+    from .models import ArticlePage, CategoryPage
+
+    articles = ArticlePage.objects.live().public().defer('body')
+    categories = CategoryPage.objects.live().public()
+    if page_ids is not None:
+        articles = articles.filter(pk__in=page_ids)
+        categories = categories.filter(pk__in=page_ids)
+
+    entries = {article.pk: build_page_entries(article) for article in articles}
+    categories = list(categories)
+    if categories:
+        article_counts = Counter(
+            path[:-ArticlePage.steplen] for path in ArticlePage.objects.live().values_list('path', flat=True)
+        )
+        for category in categories:
+            entries[category.pk] = build_page_entries(category, article_counts[category.path])
+    return entries
+
+
+def get_version():
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def page_entries_key(page_id, version=None):
+    return PAGE_ENTRIES_CACHE_KEY.format(version=version or get_version(), page_id=page_id)
+
+
+def get_entries():
+    """
+    Entries of every live article and category, keyed by page id. Which pages
+    are live comes from the database, leaving out pages behind a view
+    restriction (their own or an ancestor's), whose titles and URLs aren't
+    public; their entries come from the cache, and any that are missing are
+    built and stored.
+    """
+    from .models import ArticlePage, CategoryPage
+
+    version = get_version()
+    page_ids = list(Page.objects.live().public().type(ArticlePage, CategoryPage).values_list('pk', flat=True))
+    keys = {page_id: page_entries_key(page_id, version) for page_id in page_ids}
+    stored = cache.get_many(keys.values())
+    entries = {page_id: stored[key] for page_id, key in keys.items() if key in stored}
+
+    missing = [page_id for page_id in page_ids if page_id not in entries]
+    if missing:
+        built = build_entries(missing if len(missing) < len(page_ids) else None)
+        cache.set_many({page_entries_key(page_id, version): page_entries for page_id, page_entries in built.items()}, timeout=None)
+        entries.update(built)
+    return entries
+
+
+def get_generation():
+    generation = cache.get(GENERATION_CACHE_KEY)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        cache.add(GENERATION_CACHE_KEY, generation, timeout=None)
+        generation = cache.get(GENERATION_CACHE_KEY, generation)
+    return generation
+
+
+def bump_generation():
+    cache.set(GENERATION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def update_page(page):
+    """
+    Replace one page's entries (or drop them if the page is no longer live)
+    and tell every worker to re-sort.
+    """
+    from .models import ArticlePage, CategoryPage
+
+    page = page.specific
+    if page.live:
+        article_count = 0
+        if isinstance(page, CategoryPage):
+            article_count = ArticlePage.objects.live().child_of(page).count()
+        cache.set(page_entries_key(page.pk), build_page_entries(page, article_count), timeout=None)
+    else:
+        cache.delete(page_entries_key(page.pk))
+    bump_generation()
+
+
+def remove_page(page_id):
+    cache.delete(page_entries_key(page_id))
+    bump_generation()
+
+
+def rebuild():
+    """
+    Retire every page's entries so the next lookup rebuilds them, e.g. after
+    a move changes the URLs of a whole subtree.
+    """
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, timeout=None)
+    bump_generation()
+
+
+class TypeaheadIndex:
+    """
+    Sorted array of normalized keys for binary-search prefix lookups. Every
+    word start of a label is a key, so "acid" finds "Uric acid".
+    """
+
+    def __init__(self, entries, generation=None):
+        self.generation = generation
+        self.entries = [entry for page_entries in entries.values() for entry in page_entries]
+        keys = []
+        for position, entry in enumerate(self.entries):
+            words = normalize(entry[0]).split(' ')
+            for start in range(len(words)):
+                keys.append((' '.join(words[start:]), position))
+        keys.sort()
+        self.keys = [key for key, position in keys]
+        self.positions = [position for key, position in keys]
+
+    def search(self, query, limit=None):
+        """
+        Return up to limit {'label', 'url', 'kind', 'title'} suggestions whose
+        label has a word starting with the query, best score first, one per URL.
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        limit = limit or get_limit()
+
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\uffff', lo=start)
+        matches = sorted(
+            {self.positions[index] for index in range(start, end)},
+            key=lambda position: (-self.entries[position][3], len(self.entries[position][0]), self.entries[position][0]),
+        )
+
+        results = []
+        seen_urls = set()
+        for position in matches:
+            label, url, kind, score, title = self.entries[position]
+            if url in seen_urls:
+                continue
+            seen_urls.add(url)
+            results.append({'label': label, 'url': url, 'kind': kind, 'title': title})
+            if len(results) == limit:
+                break
+        return results
+
+
+def get_index():
+    """
+    Return this worker's index, loading it on first use and re-sorting it when
+    another process has bumped the generation since.
+    """
+    global _index
+    generation = get_generation()
+    index = _index
+    if index is None or index.generation != generation:
+        with _index_lock:
+            if _index is None or _index.generation != generation:
+                _index = TypeaheadIndex(get_entries(), generation)
+            index = _index
+    return index
+
+
+def suggest(query, limit=None):
+    return get_index().search(query, limit)
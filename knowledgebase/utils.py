@@ -2,7 +2,7 @@
 from bs4 import BeautifulSoup
 import re
 import uuid
-import markdown
+from knowledgebase.markdown_service import convert_markdown
 from django.utils.html import mark_safe
 from wagtail.blocks import StreamValue, StreamBlock
 from knowledgebase.blocks import HeadingBlock, RichTextBlock, FAQListBlock, ReferenceListBlock, BulletPointBlock
@@ -132,7 +132,7 @@ def generate_wagtail_streamfield_data(article_data):
     def convert_to_rich_text(content_str):
         """Convert a string (markdown) to rich text."""
         # print("convert_to_rich_text")
-        html_content = markdown.markdown(content_str)
+        html_content = convert_markdown(content_str, extensions=())
         return {
             "type": "rich_text",
             "value": html_content
@@ -1,3 +1,46 @@
-from django.shortcuts import render
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
 
-# Create your views here.
+from knowledgebase.models import CategoryPage
+from knowledgebase.renditions import serialize_picture
+from knowledgebase.typeahead import suggest
+
+
+def serialize_article_card(article, request):
+    picture = article.get_image_picture()
+    return {
+        'id': article.pk,
+        'title': article.title,
+        'url': article.get_url(request),
+        'intro': article.intro,
+        'image': serialize_picture(picture) if picture else None,
+    }
+
+
+@require_GET
+def category_articles(request, page_id):
+    """
+    JSON page of article cards for a category, for infinite scroll. Pass the
+    previous response's next_cursor as ?after= to get the following page.
+    """
+    category_page = get_object_or_404(CategoryPage.objects.live(), pk=page_id)
+    # Wagtail only enforces view restrictions when serving the page itself.
+    for restriction in category_page.get_view_restrictions():
+        if not restriction.accept_request(request):
+            raise Http404
+    articles, next_cursor = category_page.get_article_page(request.GET.get('after'))
+    return JsonResponse({
+        'articles': [serialize_article_card(article, request) for article in articles],
+        'next_cursor': next_cursor,
+    })
+
+
+@require_GET
+def typeahead(request):
+    """
+    JSON suggestions for the navbar search box: articles, categories and
+    article keywords with a word starting with ?q=.
+    """
+    query = request.GET.get('q', '')[:100]
+    return JsonResponse({'query': query, 'results': suggest(query)})
@@ -64,6 +64,7 @@ MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "wagtail.contrib.redirects.middleware.RedirectMiddleware",
     # "wagtail.middleware.SiteMiddleware",
+    "base.middleware.AnonymousPageCacheMiddleware",
 ]
 
 ROOT_URLCONF = "optifit_kb.urls"
@@ -178,6 +179,21 @@ WAGTAILSEARCH_BACKENDS = {
         "BACKEND": "wagtail.search.backends.database",
     }
 }
+# To search with the in-process BM25 index instead (requires numpy), use
+#     "default": {"BACKEND": "search.bm25", "INDEX_PATH": os.path.join(BASE_DIR, "search_index")}
+# and build it once with `python manage.py update_index`.
+
+# Anonymous page cache
+# Responses for anonymous visitors are cached in this cache alias and invalidated
+# by tag when pages are published/moved or snippets/settings are edited.
+PAGE_CACHE_ALIAS = "default"
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+# Static export
+# When set, publishing or unpublishing a page re-exports it (and the category and
+# index pages that list it) as static HTML under this directory, for nginx to serve.
+# The full site is exported with `python manage.py export_static_site`.
+STATIC_EXPORT_ROOT = os.environ.get("STATIC_EXPORT_ROOT") or None
 
 # Base URL to use when referring to full URLs within the Wagtail admin backend -
 # e.g. in notification emails. Don't include '/admin' or a trailing slash
@@ -42,6 +42,31 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "mediafiles")
 STATIC_URL = "/static/"
 MEDIA_URL = "/media/"
 
+# Cache
+# A filesystem cache is shared by all workers and survives restarts, so rendered
+# articles stay warm between deploys. Once a FileBasedCache holds MAX_ENTRIES
+# files, every set() deletes a random third of them, including the generation
+# and tag version keys, so the limits are sized well above the real key count:
+# per article a render, a fragment per block and typeahead entries, plus search
+# result lists. Page responses are keyed by URL and query string, so they get
+# their own directory, with their tag versions and the chrome and breadcrumb
+# snapshots, and can't push the rest out.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache"),
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": 100000},
+    },
+    "pages": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache-pages"),
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
+}
+PAGE_CACHE_ALIAS = "pages"
+
 # Logging configuration
 LOGGING = {
     "version": 1,
@@ -0,0 +1,119 @@
+// static/js/category-scroll.js
+
+// Infinite scroll for category pages: when the "Load more" link comes into view,
+// fetch the next page of cards from the JSON endpoint and append them. Without
+// JavaScript the link still works as a plain ?after= page.
+document.addEventListener('DOMContentLoaded', function() {
+    const container = document.getElementById('article-cards');
+    const loadMore = document.getElementById('load-more-articles');
+    if (!container || !loadMore || !('IntersectionObserver' in window)) {
+        return;
+    }
+
+    let loading = false;
+
+    function truncate(text, length) {
+        return text.length > length ? text.slice(0, length - 1) + '…' : text;
+    }
+
+    // Mirrors the <picture> rendered by the rendition_set template tag: one
+    // <source> per preferred format, then the fallback <img>.
+    function buildPicture(image, alt) {
+        const picture = document.createElement('picture');
+        const fallback = image.sources[image.sources.length - 1];
+        image.sources.slice(0, -1).forEach(source => {
+            const element = document.createElement('source');
+            element.srcset = source.srcset;
+            element.sizes = image.sizes;
+            element.type = source.type;
+            picture.appendChild(element);
+        });
+
+        const img = document.createElement('img');
+        img.src = image.url;
+        if (fallback) {
+            img.srcset = fallback.srcset;
+            img.sizes = image.sizes;
+        }
+        img.width = image.width;
+        img.height = image.height;
+        img.className = 'card-img-top';
+        img.alt = alt;
+        img.loading = 'lazy';
+        img.decoding = 'async';
+        picture.appendChild(img);
+        return picture;
+    }
+
+    function buildCard(article) {
+        const col = document.createElement('div');
+        col.className = 'col';
+
+        const card = document.createElement('div');
+        card.className = 'card h-100';
+        col.appendChild(card);
+
+        const link = document.createElement('a');
+        link.href = article.url;
+        link.className = 'text-decoration-none';
+        card.appendChild(link);
+
+        if (article.image) {
+            link.appendChild(buildPicture(article.image, article.title));
+        }
+
+        const body = document.createElement('div');
+        body.className = 'card-body';
+        link.appendChild(body);
+
+        const title = document.createElement('h5');
+        title.className = 'card-title';
+        title.textContent = article.title;
+        body.appendChild(title);
+
+        if (article.intro) {
+            const intro = document.createElement('p');
+            intro.className = 'card-text';
+            intro.textContent = truncate(article.intro, 150);
+            body.appendChild(intro);
+        }
+
+        return col;
+    }
+
+    function loadNextPage() {
+        const url = loadMore.dataset.nextUrl;
+        if (loading || !url) {
+            return;
+        }
+        loading = true;
+
+        fetch(url, { headers: { 'Accept': 'application/json' } })
+            .then(response => response.json())
+            .then(data => {
+                data.articles.forEach(article => container.appendChild(buildCard(article)));
+                if (data.next_cursor) {
+                    const nextUrl = new URL(url, window.location.href);
+                    nextUrl.searchParams.set('after', data.next_cursor);
+                    loadMore.dataset.nextUrl = nextUrl.toString();
+                    loadMore.href = '?after=' + encodeURIComponent(data.next_cursor);
+                } else {
+                    observer.disconnect();
+                    loadMore.parentElement.remove();
+                }
+            })
+            .finally(() => { loading = false; });
+    }
+
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadNextPage();
+        }
+    });
+    observer.observe(loadMore);
+
+    loadMore.addEventListener('click', function(event) {
+        event.preventDefault();
+        loadNextPage();
+    });
+});
@@ -0,0 +1,103 @@
+// static/js/typeahead.js
+
+// Suggestions for the navbar search box: as the user types, fetch matching
+// articles, categories and keywords from the typeahead endpoint and list them
+// under the input. Enter on a highlighted suggestion opens it; otherwise the
+// form submits a normal search.
+document.addEventListener('DOMContentLoaded', function() {
+    const input = document.getElementById('navbar-search');
+    const menu = document.getElementById('navbar-search-suggestions');
+    if (!input || !menu || !input.dataset.typeaheadUrl) {
+        return;
+    }
+
+    const kindLabels = { article: 'Article', category: 'Category', keyword: 'Keyword' };
+    let timer = null;
+    let controller = null;
+    let active = -1;
+
+    function hide() {
+        menu.classList.remove('show');
+        menu.innerHTML = '';
+        active = -1;
+    }
+
+    function render(results) {
+        menu.innerHTML = '';
+        active = -1;
+        results.forEach(result => {
+            const item = document.createElement('li');
+            const link = document.createElement('a');
+            link.className = 'dropdown-item';
+            link.href = result.url;
+            link.setAttribute('role', 'option');
+            link.textContent = result.label;
+
+            const detail = document.createElement('small');
+            detail.className = 'text-muted ms-2';
+            detail.textContent = result.kind === 'keyword' ? result.title : kindLabels[result.kind];
+            link.appendChild(detail);
+
+            item.appendChild(link);
+            menu.appendChild(item);
+        });
+        menu.classList.toggle('show', results.length > 0);
+    }
+
+    function fetchSuggestions() {
+        const query = input.value.trim();
+        if (!query) {
+            hide();
+            return;
+        }
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+
+        const url = new URL(input.dataset.typeaheadUrl, window.location.href);
+        url.searchParams.set('q', query);
+        fetch(url, { signal: controller.signal, headers: { 'Accept': 'application/json' } })
+            .then(response => response.json())
+            .then(data => render(data.results))
+            .catch(error => {
+                if (error.name !== 'AbortError') {
+                    hide();
+                }
+            });
+    }
+
+    function highlight(index) {
+        const links = menu.querySelectorAll('.dropdown-item');
+        if (!links.length) {
+            return;
+        }
+        active = (index + links.length) % links.length;
+        links.forEach((link, position) => link.classList.toggle('active', position === active));
+    }
+
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(fetchSuggestions, 120);
+    });
+
+    input.addEventListener('keydown', function(event) {
+        if (event.key === 'ArrowDown') {
+            event.preventDefault();
+            highlight(active + 1);
+        } else if (event.key === 'ArrowUp') {
+            event.preventDefault();
+            highlight(active - 1);
+        } else if (event.key === 'Enter' && active >= 0) {
+            event.preventDefault();
+            window.location.href = menu.querySelectorAll('.dropdown-item')[active].href;
+        } else if (event.key === 'Escape') {
+            hide();
+        }
+    });
+
+    input.addEventListener('blur', function() {
+        // Let clicks on a suggestion land before the menu disappears.
+        setTimeout(hide, 150);
+    });
+});
@@ -6,6 +6,7 @@ from wagtail.admin import urls as wagtailadmin_urls
 from wagtail import urls as wagtail_urls
 from wagtail.documents import urls as wagtaildocs_urls
 
+from knowledgebase import views as knowledgebase_views
 from search import views as search_views
 
 urlpatterns = [
@@ -13,6 +14,12 @@ urlpatterns = [
     path("admin/", include(wagtailadmin_urls)),
     path("documents/", include(wagtaildocs_urls)),
     path("search/", search_views.search, name="search"),
+    path("search/typeahead/", knowledgebase_views.typeahead, name="search_typeahead"),
+    path(
+        "kb/categories/<int:page_id>/articles/",
+        knowledgebase_views.category_articles,
+        name="category_articles",
+    ),
 ]
 
 
@@ -0,0 +1,707 @@
+# search/bm25.py
+"""
+In-process BM25 search backend for Wagtail.
+
+The index lives in a directory (INDEX_PATH) as a generation written by
+update_index: NumPy arrays of postings (document, field, term frequency), read
+with mmap so every worker process shares the same pages, plus a JSON file of
+terms and document keys. Publishing, unpublishing or deleting an object appends
+its new postings to the generation's journal, which each process replays before
+searching, so updates are visible everywhere without a rebuild.
+
+Enable it with:
+
+    WAGTAILSEARCH_BACKENDS = {
+        "default": {"BACKEND": "search.bm25", "INDEX_PATH": "/path/to/search_index"},
+    }
+
+and run `python manage.py update_index` once to build the first generation.
+Requires numpy.
+"""
+import bisect
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import unicodedata
+import uuid
+from collections import Counter, defaultdict
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; journal appends are then unlocked.
+    fcntl = None
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; only this backend needs it.
+    np = None
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Count, Manager, Q
+from django.utils.encoding import force_str
+from django.utils.html import strip_tags
+from wagtail.search.backends.base import (
+    BaseSearchBackend,
+    BaseSearchQueryCompiler,
+    BaseSearchResults,
+    FilterFieldError,
+    get_model_root,
+)
+from wagtail.search.index import RelatedFields, SearchField
+from wagtail.search.query import And, Boost, Fuzzy, MatchAll, Not, Or, Phrase, PlainText
+
+# Standard BM25 parameters: term frequency saturation and length normalisation.
+K1 = 1.2
+B = 0.75
+
+TOKEN_PATTERN = re.compile(r"\w+")
+CURRENT_FILE = "CURRENT"
+META_FILE = "meta.json"
+JOURNAL_FILE = "journal.jsonl"
+ARRAY_NAMES = ("offsets", "docs", "fields", "tfs", "lengths")
+
+# Candidate ids are checked against the search queryset this many at a time.
+FILTER_CHUNK_SIZE = 500
+# How many vocabulary terms the last word of an autocomplete query expands to.
+MAX_PREFIX_EXPANSIONS = 50
+
+
+def tokenize(text):
+    """
+    Lowercase, strip accents and split text into word tokens.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return TOKEN_PATTERN.findall(text)
+
+
+def prepare_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return " ".join(prepare_value(item) for item in value)
+    if isinstance(value, dict):
+        return " ".join(prepare_value(item) for item in value.values())
+    return force_str(value)
+
+
+def iter_field_values(obj, search_fields, prefix=""):
+    """
+    Yield (field name, boost, text) for an object's SearchFields, following
+    RelatedFields (e.g. an article's category title as 'category.title').
+    """
+    for field in search_fields:
+        if isinstance(field, SearchField):
+            yield f"{prefix}{field.field_name}", field.boost or 1, prepare_value(field.get_value(obj))
+
+        elif isinstance(field, RelatedFields):
+            related = field.get_value(obj)
+            if related is None:
+                continue
+            if isinstance(related, Manager):
+                related_objects = related.all()
+            else:
+                related_objects = [related() if callable(related) else related]
+            for related_object in related_objects:
+                yield from iter_field_values(related_object, field.fields, f"{prefix}{field.field_name}.")
+
+
+def field_key(name, boost):
+    return f"{name}^{boost:g}"
+
+
+def parse_field_key(key):
+    name, boost = key.rsplit("^", 1)
+    return name, float(boost)
+
+
+def document_key(obj):
+    return f"{get_model_root(type(obj))._meta.label_lower}:{obj.pk}"
+
+
+def build_document(obj):
+    """
+    Return {field key: {term: frequency}} for an object. The field key carries
+    the field's boost, so ArticlePage's title (boost 2) outweighs its body.
+    """
+    fields = defaultdict(Counter)
+    for name, boost, text in iter_field_values(obj, obj.get_search_fields()):
+        tokens = tokenize(strip_tags(text))
+        if tokens:
+            fields[field_key(name, boost)].update(tokens)
+    return {key: dict(counts) for key, counts in fields.items()}
+
+
+def document_length(fields):
+    return sum(parse_field_key(key)[1] * sum(counts.values()) for key, counts in fields.items())
+
+
+def load_array(path):
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:  # Empty arrays can't be memory-mapped.
+        return np.load(path)
+
+
+class Segment:
+    """
+    The immutable, memory-mapped part of the index written by update_index.
+    Postings for term i are docs/fields/tfs[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, directory=None):
+        meta = {"terms": [], "fields": [], "docs": []}
+        if directory is not None and (directory / META_FILE).exists():
+            meta = json.loads((directory / META_FILE).read_text())
+            arrays = {name: load_array(directory / f"{name}.npy") for name in ARRAY_NAMES}
+        else:
+            arrays = {
+                "offsets": np.zeros(1, dtype=np.int64),
+                "docs": np.zeros(0, dtype=np.int32),
+                "fields": np.zeros(0, dtype=np.int16),
+                "tfs": np.zeros(0, dtype=np.float32),
+                "lengths": np.zeros(0, dtype=np.float32),
+            }
+
+        self.terms = meta["terms"]  # sorted, so prefixes can be found with bisect
+        self.term_ids = {term: term_id for term_id, term in enumerate(self.terms)}
+        self.field_keys = meta["fields"]
+        self.doc_keys = meta["docs"]
+        self.key_ids = {key: doc_id for doc_id, key in enumerate(self.doc_keys)}
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+    def __len__(self):
+        return len(self.doc_keys)
+
+    def postings(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return None
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.docs[start:end], self.fields[start:end], self.tfs[start:end]
+
+
+def write_segment(directory, documents):
+    """
+    Write {document key: fields} as a segment into an empty directory.
+    """
+    doc_keys = sorted(documents)
+    field_keys = sorted({key for fields in documents.values() for key in fields})
+    field_ids = {key: field_id for field_id, key in enumerate(field_keys)}
+
+    postings = defaultdict(list)
+    lengths = np.zeros(len(doc_keys), dtype=np.float32)
+    for doc_id, key in enumerate(doc_keys):
+        fields = documents[key]
+        lengths[doc_id] = document_length(fields)
+        for key_of_field, counts in fields.items():
+            for term, frequency in counts.items():
+                postings[term].append((doc_id, field_ids[key_of_field], frequency))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(postings[term]) for term in terms], out=offsets[1:])
+    entries = [entry for term in terms for entry in postings[term]]
+    columns = np.array(entries, dtype=np.float64).reshape(-1, 3)
+
+    np.save(directory / "offsets.npy", offsets)
+    np.save(directory / "docs.npy", columns[:, 0].astype(np.int32))
+    np.save(directory / "fields.npy", columns[:, 1].astype(np.int16))
+    np.save(directory / "tfs.npy", columns[:, 2].astype(np.float32))
+    np.save(directory / "lengths.npy", lengths)
+    (directory / META_FILE).write_text(json.dumps({"terms": terms, "fields": field_keys, "docs": doc_keys}))
+    (directory / JOURNAL_FILE).touch()
+
+
+class IndexState:
+    """
+    A segment plus the journal entries replayed on top of it. Journalled
+    documents replace (or delete) the segment's copy of the same key.
+    """
+
+    def __init__(self, generation, segment, documents=None, deleted=None, journal_offset=0):
+        self.generation = generation
+        self.segment = segment
+        self.documents = documents or {}
+        self.deleted = deleted or set()
+        self.journal_offset = journal_offset
+
+        self.alive = np.ones(len(segment), dtype=bool)
+        for key in self.deleted.union(self.documents):
+            doc_id = segment.key_ids.get(key)
+            if doc_id is not None:
+                self.alive[doc_id] = False
+
+        self.delta_postings = defaultdict(list)
+        self.delta_lengths = {}
+        for key, fields in self.documents.items():
+            self.delta_lengths[key] = document_length(fields)
+            for key_of_field, counts in fields.items():
+                for term, frequency in counts.items():
+                    self.delta_postings[term].append((key, key_of_field, frequency))
+        self.delta_terms = sorted(self.delta_postings)
+
+        self.doc_count = int(self.alive.sum()) + len(self.documents)
+        total_length = float(segment.lengths[self.alive].sum()) + sum(self.delta_lengths.values())
+        self.avg_length = total_length / self.doc_count if self.doc_count else 1.0
+
+    def with_entries(self, entries, journal_offset):
+        documents = dict(self.documents)
+        deleted = set(self.deleted)
+        for entry in entries:
+            if entry["op"] == "add":
+                documents[entry["key"]] = entry["fields"]
+                deleted.discard(entry["key"])
+            else:
+                documents.pop(entry["key"], None)
+                deleted.add(entry["key"])
+        return IndexState(self.generation, self.segment, documents, deleted, journal_offset)
+
+    def prefix_terms(self, prefix):
+        """
+        Terms starting with prefix, from the segment and the journal.
+        """
+        found = []
+        for terms in (self.segment.terms, self.delta_terms):
+            start = bisect.bisect_left(terms, prefix)
+            for term in terms[start:start + MAX_PREFIX_EXPANSIONS]:
+                if not term.startswith(prefix):
+                    break
+                found.append(term)
+        return sorted(set(found))[:MAX_PREFIX_EXPANSIONS]
+
+
+class Match:
+    """
+    Scores and matched flags for segment documents (as arrays) and journalled
+    documents (as a dict), combined by the boolean query operators.
+    """
+
+    def __init__(self, scores, matched, delta):
+        self.scores = scores
+        self.matched = matched
+        self.delta = delta
+
+    @classmethod
+    def empty(cls, state):
+        size = len(state.segment)
+        return cls(np.zeros(size), np.zeros(size, dtype=bool), {})
+
+    @classmethod
+    def everything(cls, state):
+        return cls(np.zeros(len(state.segment)), state.alive.copy(), dict.fromkeys(state.documents, 0.0))
+
+    def __or__(self, other):
+        delta = dict(self.delta)
+        for key, score in other.delta.items():
+            delta[key] = delta.get(key, 0.0) + score
+        return Match(self.scores + other.scores, self.matched | other.matched, delta)
+
+    def __and__(self, other):
+        matched = self.matched & other.matched
+        delta = {key: score + other.delta[key] for key, score in self.delta.items() if key in other.delta}
+        return Match(np.where(matched, self.scores + other.scores, 0.0), matched, delta)
+
+    def negate(self, state):
+        everything = Match.everything(state)
+        matched = everything.matched & ~self.matched
+        delta = {key: 0.0 for key in everything.delta if key not in self.delta}
+        return Match(np.zeros(len(state.segment)), matched, delta)
+
+    def boosted(self, factor):
+        return Match(self.scores * factor, self.matched, {key: score * factor for key, score in self.delta.items()})
+
+    def ranked(self, state, key_prefix):
+        """
+        Return [(pk, score)] for matched documents whose key starts with
+        key_prefix, best first.
+        """
+        results = []
+        doc_ids = np.flatnonzero(self.matched)
+        for doc_id in doc_ids[np.argsort(-self.scores[doc_ids], kind="stable")]:
+            key = state.segment.doc_keys[doc_id]
+            if key.startswith(key_prefix):
+                results.append((key[len(key_prefix):], float(self.scores[doc_id])))
+        results.extend(
+            (key[len(key_prefix):], score) for key, score in self.delta.items() if key.startswith(key_prefix)
+        )
+        results.sort(key=lambda result: -result[1])
+        return results
+
+
+class Scorer:
+    """
+    Evaluates Wagtail query objects against an index state with BM25.
+    """
+
+    def __init__(self, state, fields=None, prefix_last_term=False):
+        self.state = state
+        self.fields = fields
+        self.prefix_last_term = prefix_last_term
+        self.field_weights = np.array(
+            [self.field_weight(key) for key in state.segment.field_keys] or [0.0], dtype=np.float64
+        )
+        segment_lengths = np.asarray(state.segment.lengths, dtype=np.float64)
+        self.length_norm = K1 * (1 - B + B * segment_lengths / state.avg_length)
+
+    def field_weight(self, key):
+        name, boost = parse_field_key(key)
+        if self.fields and not any(name == field or name.startswith(f"{field}.") for field in self.fields):
+            return 0.0
+        return boost
+
+    def idf(self, document_frequency):
+        count = self.state.doc_count
+        return math.log(1 + (count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def term(self, term):
+        state = self.state
+        match = Match.empty(state)
+
+        postings = state.segment.postings(term)
+        if postings is not None:
+            docs, fields, tfs = postings
+            weighted = np.bincount(docs, weights=self.field_weights[fields] * tfs, minlength=len(state.segment))
+            match.matched = (weighted > 0) & state.alive
+            match.scores = weighted
+
+        delta_weighted = defaultdict(float)
+        for key, key_of_field, frequency in state.delta_postings.get(term, ()):
+            delta_weighted[key] += self.field_weight(key_of_field) * frequency
+        delta_weighted = {key: weight for key, weight in delta_weighted.items() if weight > 0}
+
+        document_frequency = int(match.matched.sum()) + len(delta_weighted)
+        if not document_frequency:
+            return Match.empty(state)
+        idf = self.idf(document_frequency)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = idf * match.scores * (K1 + 1) / (match.scores + self.length_norm)
+        match.scores = np.where(match.matched, scores, 0.0)
+        for key, weight in delta_weighted.items():
+            norm = K1 * (1 - B + B * state.delta_lengths[key] / state.avg_length)
+            match.delta[key] = idf * weight * (K1 + 1) / (weight + norm)
+        return match
+
+    def prefix(self, prefix):
+        match = Match.empty(self.state)
+        for term in self.state.prefix_terms(prefix):
+            match = match | self.term(term)
+        return match
+
+    def combine(self, matches, operator):
+        if not matches:
+            return Match.empty(self.state)
+        result = matches[0]
+        for match in matches[1:]:
+            result = (result & match) if operator == "and" else (result | match)
+        return result
+
+    def evaluate(self, query):
+        if isinstance(query, MatchAll):
+            return Match.everything(self.state)
+
+        if isinstance(query, (PlainText, Phrase, Fuzzy)):
+            # Phrases are matched as all of their words; fuzzy terms exactly.
+            text = query.query_string
+            operator = getattr(query, "operator", "and" if isinstance(query, Phrase) else "or")
+            tokens = tokenize(text)
+            matches = [self.term(token) for token in tokens]
+            if self.prefix_last_term and tokens:
+                matches[-1] = self.prefix(tokens[-1])
+            match = self.combine(matches, operator)
+            boost = getattr(query, "boost", 1.0)
+            return match.boosted(boost) if boost != 1.0 else match
+
+        if isinstance(query, And):
+            return self.combine([self.evaluate(subquery) for subquery in query.subqueries], "and")
+
+        if isinstance(query, Or):
+            return self.combine([self.evaluate(subquery) for subquery in query.subqueries], "or")
+
+        if isinstance(query, Not):
+            return self.evaluate(query.subquery).negate(self.state)
+
+        if isinstance(query, Boost):
+            return self.evaluate(query.subquery).boosted(query.boost)
+
+        raise NotImplementedError(f"The BM25 search backend doesn't support {type(query).__name__} queries.")
+
+
+class BM25Index:
+    """
+    One index directory, shared by every model. Only one instance exists per
+    directory in a process (see get_index), holding the loaded state.
+    """
+
+    name = "bm25"
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._state = None
+
+    # Indexing API used by Wagtail's signal handlers and update_index
+
+    def add_model(self, model):
+        pass
+
+    def refresh(self):
+        pass
+
+    def add_item(self, item):
+        self.add_items(type(item), [item])
+
+    def add_items(self, model, items):
+        self.append_journal([{"op": "add", "key": document_key(item), "fields": build_document(item)} for item in items])
+
+    def delete_item(self, item):
+        self.append_journal([{"op": "delete", "key": document_key(item)}])
+
+    def reset(self):
+        self.write_generation({})
+
+    # Storage
+
+    def get_generation(self):
+        """
+        Return the current generation's directory name, creating an empty
+        generation if the index has never been built.
+        """
+        try:
+            return (self.path / CURRENT_FILE).read_text().strip()
+        except FileNotFoundError:
+            return self.write_generation({})
+
+    def write_generation(self, documents):
+        """
+        Write documents as a new generation and make it current. Processes
+        still reading the previous generation keep their mapped files.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        generation = f"gen-{uuid.uuid4().hex}"
+        directory = self.path / generation
+        directory.mkdir()
+        write_segment(directory, documents)
+
+        temporary = self.path / f"{CURRENT_FILE}.{generation}"
+        temporary.write_text(generation)
+        os.replace(temporary, self.path / CURRENT_FILE)
+
+        for old in self.path.glob("gen-*"):
+            if old.name != generation:
+                shutil.rmtree(old, ignore_errors=True)
+        return generation
+
+    def append_journal(self, entries):
+        if not entries:
+            return
+        lines = "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in entries)
+        journal = self.path / self.get_generation() / JOURNAL_FILE
+        with open(journal, "a", encoding="utf-8") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            handle.write(lines)
+            handle.flush()
+
+    def get_state(self):
+        """
+        Return the index state, reloading the segment after a rebuild and
+        replaying journal entries appended since the last search.
+        """
+        with self._lock:
+            generation = self.get_generation()
+            state = self._state
+            if state is None or state.generation != generation:
+                state = IndexState(generation, Segment(self.path / generation))
+
+            journal = self.path / generation / JOURNAL_FILE
+            try:
+                size = journal.stat().st_size
+            except FileNotFoundError:
+                size = state.journal_offset
+            if size > state.journal_offset:
+                with open(journal, "rb") as handle:
+                    handle.seek(state.journal_offset)
+                    data = handle.read(size - state.journal_offset)
+                complete = data[:data.rfind(b"\n") + 1]
+                entries = [json.loads(line) for line in complete.splitlines() if line]
+                state = state.with_entries(entries, state.journal_offset + len(complete))
+
+            self._state = state
+            return state
+
+
+class BM25IndexBuilder:
+    """
+    Collects documents during update_index and writes them as a new
+    generation when the rebuild finishes.
+    """
+
+    name = BM25Index.name
+
+    def __init__(self, index):
+        self.index = index
+        self.documents = {}
+
+    def add_model(self, model):
+        pass
+
+    def refresh(self):
+        pass
+
+    def add_item(self, item):
+        self.add_items(type(item), [item])
+
+    def add_items(self, model, items):
+        for item in items:
+            self.documents[document_key(item)] = build_document(item)
+
+    def delete_item(self, item):
+        self.documents.pop(document_key(item), None)
+
+
+class BM25IndexRebuilder:
+    def __init__(self, index):
+        self.index = index
+        self.builder = None
+
+    def start(self):
+        self.builder = BM25IndexBuilder(self.index)
+        return self.builder
+
+    def finish(self):
+        self.index.write_generation(self.builder.documents)
+
+
+class BM25SearchQueryCompiler(BaseSearchQueryCompiler):
+    prefix_last_term = False
+
+    def _process_lookup(self, field, lookup, value):
+        return Q(**{field.get_attname(self.queryset.model) + "__" + lookup: value})
+
+    def _connect_filters(self, filters, connector, negated):
+        if connector == "AND":
+            q = Q(*filters)
+        elif connector == "OR":
+            q = Q()
+            for query_filter in filters:
+                q |= query_filter
+        else:
+            return None
+        return ~q if negated else q
+
+    def get_ranked(self, backend):
+        """
+        Return [(pk, score)] of the matching objects the search queryset
+        contains, in result order. Computed once per query.
+        """
+        if getattr(self, "_ranked", None) is None:
+            state = backend.index.get_state()
+            match = Scorer(state, self.fields, self.prefix_last_term).evaluate(self.query)
+            key_prefix = f"{get_model_root(self.queryset.model)._meta.label_lower}:"
+            candidates = match.ranked(state, key_prefix)
+            scores = dict(candidates)
+
+            if self.order_by_relevance:
+                allowed = set()
+                pks = [pk for pk, score in candidates]
+                for start in range(0, len(pks), FILTER_CHUNK_SIZE):
+                    chunk = pks[start:start + FILTER_CHUNK_SIZE]
+                    allowed.update(str(pk) for pk in self.queryset.filter(pk__in=chunk).values_list("pk", flat=True))
+                self._ranked = [(pk, score) for pk, score in candidates if pk in allowed]
+            else:
+                ordered = self.queryset.filter(pk__in=list(scores)).values_list("pk", flat=True)
+                self._ranked = [(str(pk), scores[str(pk)]) for pk in ordered]
+        return self._ranked
+
+
+class BM25AutocompleteQueryCompiler(BM25SearchQueryCompiler):
+    prefix_last_term = True
+
+
+class BM25SearchResults(BaseSearchResults):
+    supports_facet = True
+
+    def _do_search(self):
+        ranked = self.query_compiler.get_ranked(self.backend)[self.start:self.stop]
+        objects = {
+            str(obj.pk): obj
+            for obj in self.query_compiler.queryset.filter(pk__in=[pk for pk, score in ranked])
+        }
+        results = []
+        for pk, score in ranked:
+            obj = objects.get(pk)
+            if obj is None:
+                continue
+            if self._score_field:
+                setattr(obj, self._score_field, score)
+            results.append(obj)
+        return results
+
+    def _do_count(self):
+        return len(self.query_compiler.get_ranked(self.backend)[self.start:self.stop])
+
+    def facet(self, field_name):
+        field = self.query_compiler._get_filterable_field(field_name)
+        if field is None:
+            raise FilterFieldError(
+                'Cannot facet search results with field "'
+                + field_name
+                + "\". Please add index.FilterField('"
+                + field_name
+                + "') to "
+                + self.query_compiler.queryset.model.__name__
+                + ".search_fields.",
+                field_name=field_name,
+            )
+
+        pks = [pk for pk, score in self.query_compiler.get_ranked(self.backend)]
+        results = (
+            self.query_compiler.queryset.filter(pk__in=pks)
+            .values(field_name).annotate(count=Count("pk")).order_by("-count")
+        )
+        return {result[field_name]: result["count"] for result in results}
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path):
+    path = os.path.abspath(path)
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = BM25Index(path)
+        return _indexes[path]
+
+
+class BM25SearchBackend(BaseSearchBackend):
+    query_compiler_class = BM25SearchQueryCompiler
+    autocomplete_query_compiler_class = BM25AutocompleteQueryCompiler
+    results_class = BM25SearchResults
+    rebuilder_class = BM25IndexRebuilder
+
+    def __init__(self, params):
+        super().__init__(params)
+        if np is None:
+            raise ImproperlyConfigured("The BM25 search backend requires numpy (pip install numpy).")
+        index_path = params.get("INDEX_PATH") or os.path.join(settings.BASE_DIR, "search_index")
+        self.index = get_index(index_path)
+
+    def get_index_for_model(self, model):
+        return self.index
+
+    def reset_index(self):
+        self.index.reset()
+
+
+SearchBackend = BM25SearchBackend
@@ -0,0 +1,80 @@
+# search/result_cache.py
+import hashlib
+import unicodedata
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from base import singleflight
+
+GENERATION_KEY = "kb:search:generation"
+RESULTS_KEY = "kb:search:results:{generation}:{mode}:{digest}"
+
+# Words that don't change which health articles match, so "what is gout" and
+# "gout" share one cache entry. The normalized query is what gets searched, so
+# one-letter words like "a" and "i" stay: they name things ("Hepatitis A",
+# "Type I diabetes").
+STOP_WORDS = frozenset("""
+    about an and are as at be by can do does for from how in is it of on or
+    that the this to was what when where which who why will with
+""".split())
+
+
+def get_timeout():
+    return getattr(settings, 'KB_SEARCH_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_max_results():
+    return getattr(settings, 'KB_SEARCH_CACHE_MAX_RESULTS', 1000)
+
+
+def normalize_query(query):
+    """
+    Normalize a query for searching and caching: Unicode compatibility forms,
+    case, accents and whitespace are folded and stop words dropped, so "Gout ",
+    "GOUT" and "what is gout" become "gout". A query of only stop words keeps
+    them.
+    """
+    text = unicodedata.normalize('NFKD', str(query)).casefold()
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    words = text.split()
+    meaningful = [word for word in words if word not in STOP_WORDS]
+    return ' '.join(meaningful or words)
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    """
+    Drop every cached result list at once: entries are keyed by generation, so
+    the old ones are simply never read again and expire.
+    """
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def get_results(mode, normalized_query, compute):
+    """
+    Return the cached result entry for a normalized query in a search mode,
+    calling compute(normalized_query) and caching its return value on a miss.
+    Concurrent misses for the same entry (say, a trending query right after a
+    publish) wait for one search instead of each running it.
+    """
+    digest = hashlib.sha1(normalized_query.encode('utf-8')).hexdigest()
+    key = RESULTS_KEY.format(generation=get_generation(), mode=mode, digest=digest)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    def search_and_store():
+        entry = compute(normalized_query)
+        cache.set(key, entry, timeout=get_timeout())
+        return entry
+
+    return singleflight.coalesce(key, search_and_store, lambda: cache.get(key))
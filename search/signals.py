@@ -0,0 +1,28 @@
+# search/signals.py
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from wagtail.models import Page
+from wagtail.signals import page_published, page_unpublished, post_page_move
+
+from base import batching
+from search import result_cache
+
+
+@receiver(page_published)
+@receiver(page_unpublished)
+@receiver(post_page_move)
+@batching.deferred_in_batch
+def invalidate_search_results(sender, **kwargs):
+    # Any page can appear in the all-pages search, and article results carry
+    # category titles, so every publish starts a new result generation.
+    result_cache.bump_generation()
+
+
+@batching.on_flush
+def invalidate_search_results_for_batch(pages):
+    result_cache.bump_generation()
+
+
+@receiver(post_delete, sender=Page)
+def invalidate_search_results_on_delete(sender, **kwargs):
+    result_cache.bump_generation()
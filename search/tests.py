@@ -0,0 +1,166 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from wagtail.search.backends import get_search_backend
+
+from knowledgebase.models import ArticlePage
+from knowledgebase.tests import KnowledgebaseTestCase
+from search import bm25, result_cache, views
+
+
+class ArticleSearchTests(KnowledgebaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.skin = self.create_category("Skin")
+        # Every article shares the fixture body, so queries target the intros.
+        self.create_article(self.category_page, "Gout flare", intro="A painful tophus.")
+        self.create_article(self.category_page, "Chronic gout", intro="Tophus deposits.")
+        self.create_article(self.skin, "Gout tophi", intro="A tophus under the skin.")
+        self.create_article(self.skin, "Eczema", intro="Dry, itchy skin.")
+
+    def search(self, **params):
+        return self.client.get(reverse("search"), {"type": "articles", **params})
+
+    def test_facets_count_matches_per_category(self):
+        response = self.search(query="tophus")
+        facets = {facet["title"]: facet["count"] for facet in response.context["facets"]}
+        self.assertEqual(facets, {"Joints": 2, "Skin": 1})
+        self.assertEqual(response.context["search_results"].paginator.count, 3)
+        self.assertContains(response, "Skin (1)")
+
+    def test_category_filter(self):
+        response = self.search(query="tophus", category=self.skin.pk)
+        titles = [result.title for result in response.context["search_results"]]
+        self.assertEqual(titles, ["Gout tophi"])
+        self.assertEqual(response.context["search_results"].paginator.count, 1)
+        # Facets still cover every category, so the user can switch between them.
+        self.assertEqual(len(response.context["facets"]), 2)
+
+    def test_results_are_loaded_in_one_batch(self):
+        for number in range(5):
+            self.create_article(self.skin, f"Note {number}", intro="Another tophus.")
+        # Warm Site root paths, the chrome snapshot and both cached result lists.
+        self.search(query="tophus")
+        self.search(query="eczema")
+
+        with CaptureQueriesContext(connection) as few:
+            self.search(query="eczema")
+        with CaptureQueriesContext(connection) as many:
+            response = self.search(query="tophus")
+
+        self.assertEqual(len(response.context["search_results"]), 8)
+        self.assertEqual(len(many), len(few))
+        self.assertNotIn("body", response.context["search_results"][0].__dict__)
+
+    def test_default_mode_searches_every_page_type(self):
+        response = self.client.get(reverse("search"), {"query": "skin"})
+        titles = {result.title for result in response.context["search_results"]}
+        self.assertIn("Skin", titles)
+        self.assertEqual(response.context["facets"], [])
+
+
+class SearchResultCacheTests(KnowledgebaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_article(self.category_page, "Gout flare", intro="A painful tophus.")
+
+    def search(self, query, **params):
+        return self.client.get(reverse("search"), {"query": query, "type": "articles", **params})
+
+    def test_normalize_query(self):
+        self.assertEqual(result_cache.normalize_query("  Gout  "), "gout")
+        self.assertEqual(result_cache.normalize_query("GOUT"), "gout")
+        self.assertEqual(result_cache.normalize_query("What is a Tophus?"), "a tophus?")
+        self.assertEqual(result_cache.normalize_query("what is gout"), "gout")
+        self.assertEqual(result_cache.normalize_query("Hepatitis A"), "hepatitis a")
+        self.assertEqual(result_cache.normalize_query("Vitamin A"), "vitamin a")
+        self.assertEqual(result_cache.normalize_query("Type I diabetes"), "type i diabetes")
+        self.assertEqual(result_cache.normalize_query("Gicht und Goût"), "gicht und gout")
+        self.assertEqual(result_cache.normalize_query("the"), "the")
+        self.assertEqual(result_cache.normalize_query("   "), "")
+
+    def test_equivalent_queries_share_one_cached_search(self):
+        with mock.patch("search.views.rank_articles", wraps=views.rank_articles) as rank:
+            first = self.search("tophus")
+            for query in ("Tophus ", "TOPHUS", "the tophus"):
+                response = self.search(query)
+                self.assertEqual(
+                    [result.title for result in response.context["search_results"]],
+                    [result.title for result in first.context["search_results"]],
+                )
+        self.assertEqual(rank.call_count, 1)
+
+    def test_publish_and_unpublish_drop_cached_results(self):
+        self.assertEqual(self.search("tophus").context["search_results"].paginator.count, 1)
+
+        article = self.create_article(self.category_page, "Chronic gout", intro="Tophus deposits.")
+        self.assertEqual(self.search("tophus").context["search_results"].paginator.count, 2)
+
+        article.unpublish()
+        self.assertEqual(self.search("tophus").context["search_results"].paginator.count, 1)
+
+    def test_pages_are_sliced_from_the_cached_list(self):
+        for number in range(12):
+            self.create_article(self.category_page, f"Note {number}", intro="Another tophus.")
+        first_page = self.search("tophus").context["search_results"]
+        second_page = self.search("tophus", page=2).context["search_results"]
+        self.assertEqual(first_page.paginator.count, 13)
+        self.assertEqual(len(first_page), 10)
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse({page.pk for page in first_page} & {page.pk for page in second_page})
+
+
+class BM25BackendTests(KnowledgebaseTestCase):
+    def setUp(self):
+        index_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, index_path, ignore_errors=True)
+        self.enterContext(override_settings(WAGTAILSEARCH_BACKENDS={
+            "default": {"BACKEND": "wagtail.search.backends.database"},
+            "bm25": {"BACKEND": "search.bm25", "INDEX_PATH": index_path},
+        }))
+        super().setUp()
+        self.create_article(self.category_page, "Bursitis", intro="Inflamed bursa, sometimes mistaken for gout.")
+        self.create_article(self.category_page, "Tendinitis", intro="Inflamed tendon.")
+        call_command("update_index", backend_name="bm25", verbosity=0)
+
+    def search(self, query, queryset=None, **kwargs):
+        queryset = queryset if queryset is not None else ArticlePage.objects.live()
+        return [page.title for page in queryset.search(query, backend="bm25", **kwargs)]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.search("gout")[0], "Gout")
+        self.assertEqual(set(self.search("gout")), {"Gout", "Bursitis", "Tendinitis"})
+        self.assertEqual(self.search("inflamed bursa", operator="and"), ["Bursitis"])
+
+    def test_index_is_updated_on_publish_unpublish_and_delete(self):
+        article = self.create_article(self.category_page, "Plantar fasciitis", intro="Heel pain.")
+        self.assertEqual(self.search("heel"), ["Plantar fasciitis"])
+
+        article.unpublish()
+        self.assertEqual(self.search("heel"), [])
+        self.assertEqual(self.search("heel", ArticlePage.objects.all()), ["Plantar fasciitis"])
+
+        article.delete()
+        self.assertEqual(self.search("heel", ArticlePage.objects.all()), [])
+
+    def test_fresh_worker_loads_the_index_from_disk(self):
+        bm25.get_index(get_search_backend("bm25").index.path)._state = None
+        self.assertEqual(self.search("tendon"), ["Tendinitis"])
+
+    def test_filters_facets_counts_and_autocomplete(self):
+        skin = self.create_category("Skin")
+        self.create_article(skin, "Gout tophi", intro="A tophus under the skin.")
+        results = ArticlePage.objects.live().search("gout", backend="bm25")
+        self.assertEqual(results.facet("category_id"), {self.category_page.pk: 3, skin.pk: 1})
+        self.assertEqual(results.count(), 4)
+        filtered = ArticlePage.objects.live().filter(category_id=skin.pk)
+        self.assertEqual(self.search("gout", filtered), ["Gout tophi"])
+
+        completions = ArticlePage.objects.live().autocomplete("tend", backend="bm25")
+        self.assertEqual([page.title for page in completions], ["Tendinitis"])
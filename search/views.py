@@ -4,6 +4,9 @@ from django.template.response import TemplateResponse
 
 from wagtail.models import Page
 
+from knowledgebase.models import ArticlePage, CategoryPage
+from search import result_cache
+
 # To enable logging of search queries for use with the "Promoted search results" module
 # <https://docs.wagtail.org/en/stable/reference/contrib/searchpromotions.html>
 # uncomment the following line and the lines indicated in the search function
@@ -11,14 +14,112 @@ from wagtail.models import Page
 
 # from wagtail.contrib.search_promotions.models import Query
 
+RESULTS_PER_PAGE = 10
+
+ARTICLES_MODE = "articles"
+PAGES_MODE = "pages"
+
+
+class RankedResults:
+    """
+    A cached, ranked list of page ids that Paginator can slice: the total is
+    the length of the list, and each slice loads just its pages in one query,
+    in rank order.
+    """
+
+    def __init__(self, ids, queryset):
+        self.ids = ids
+        self.queryset = queryset
+
+    def count(self):
+        return len(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, key):
+        ids = self.ids[key]
+        if not isinstance(key, slice):
+            ids = [ids]
+        pages = self.queryset.in_bulk(ids)
+        results = [pages[pk] for pk in ids if pk in pages]
+        if not isinstance(key, slice):
+            return results[0]
+        return results
+
+
+def parse_category_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def rank_articles(normalized_query):
+    """
+    Search live articles and return the cacheable result entry:
+    {'results': [[id, category_id], ...] in rank order, 'categories': {id: title}}.
+    """
+    limit = result_cache.get_max_results()
+    articles = ArticlePage.objects.live().defer("body").search(normalized_query)[:limit]
+    results = [[article.pk, article.category_id] for article in articles]
+    category_ids = {category_id for pk, category_id in results if category_id is not None}
+    categories = dict(CategoryPage.objects.filter(pk__in=category_ids).values_list("pk", "title"))
+    return {"results": results, "categories": categories}
+
+
+def rank_pages(normalized_query):
+    limit = result_cache.get_max_results()
+    return [page.pk for page in Page.objects.live().search(normalized_query)[:limit]]
+
+
+def search_articles(normalized_query, category_id=None):
+    """
+    Search live articles only. Returns (results, facets, category_titles), where
+    facets is a list of {'id', 'title', 'count'} dicts, one per category with
+    matches. The ranked ids come from the result cache, so facets, the category
+    filter and pagination are all worked out from one cached list.
+    """
+    entry = result_cache.get_results(ARTICLES_MODE, normalized_query, rank_articles)
+    titles = entry["categories"]
+
+    facet_counts = {}
+    for pk, article_category_id in entry["results"]:
+        facet_counts[article_category_id] = facet_counts.get(article_category_id, 0) + 1
+    facets = [
+        {"id": pk, "title": titles[pk], "count": count}
+        for pk, count in facet_counts.items()
+        if pk in titles
+    ]
+
+    ids = [
+        pk for pk, article_category_id in entry["results"]
+        if category_id is None or article_category_id == category_id
+    ]
+    results = RankedResults(ids, ArticlePage.objects.live().defer("body"))
+    return results, facets, titles
+
+
+def search_pages(normalized_query):
+    ids = result_cache.get_results(PAGES_MODE, normalized_query, rank_pages)
+    return RankedResults(ids, Page.objects.live())
+
 
 def search(request):
     search_query = request.GET.get("query", None)
     page = request.GET.get("page", 1)
+    mode = request.GET.get("type", "")
+    category_id = parse_category_id(request.GET.get("category"))
+    normalized_query = result_cache.normalize_query(search_query or "")
+    facets = []
+    category_titles = {}
 
     # Search
-    if search_query:
-        search_results = Page.objects.live().search(search_query)
+    if normalized_query and mode == ARTICLES_MODE:
+        search_results, facets, category_titles = search_articles(normalized_query, category_id)
+
+    elif normalized_query:
+        search_results = search_pages(normalized_query)
 
         # To log this query for use with the "Promoted search results" module:
 
@@ -29,7 +130,7 @@ def search(request):
         search_results = Page.objects.none()
 
     # Pagination
-    paginator = Paginator(search_results, 10)
+    paginator = Paginator(search_results, RESULTS_PER_PAGE)
     try:
         search_results = paginator.page(page)
     except PageNotAnInteger:
@@ -37,6 +138,12 @@ def search(request):
     except EmptyPage:
         search_results = paginator.page(paginator.num_pages)
 
+    # Article results are already specific pages (with the body deferred); label
+    # them with their category from the titles loaded for the facets.
+    for result in search_results:
+        if isinstance(result, ArticlePage):
+            result.category_title = category_titles.get(result.category_id, "")
+
     # Create a mock Page object
     mock_page = Page(title="Search")  # Use a generic Page object
 
@@ -46,6 +153,9 @@ def search(request):
         {
             "search_query": search_query,
             "search_results": search_results,
+            "search_type": mode,
+            "category_id": category_id,
+            "facets": facets,
             "page": mock_page
         },
     )